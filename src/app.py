@@ -3,117 +3,144 @@ from flask_cors import CORS
 from flask_session import Session
 from ragapp.views import ragapp_bp
 from ragapp.models import ChatHistory
+from ragapp.persistence import write_behind
+from ragapp.responseLLM import get_response_llm, start_warmup
 from user.views import user_bp
 from user.auth import auth_bp
 from chromvec.views import chroma_bp
 from extensions import init_extensions, db, limiter
+from config import (
+    PRELOAD_MODELS, DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING
+)
 import os
 import logging
 import tempfile
-from flask_jwt_extended import JWTManager
-from flask_migrate import Migrate
 from dotenv import load_dotenv
 from datetime import timedelta
-import chromadb
-from chromadb.config import Settings
 from flask_limiter.errors import RateLimitExceeded
- 
+
 load_dotenv()
- 
-# Initialize Flask app
-app = Flask(__name__)
- 
-# Configure CORS for all routes
-CORS(app, resources={
-    r"/*": {
-        "origins": ["http://localhost:3000", "http://127.0.0.1:3000"],
-        "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
-        "supports_credentials": True
-    }
-})
- 
- 
- 
-chroma_client = chromadb.HttpClient(
-    host="chroma-container",
-    port=8000,
-    settings=Settings(allow_reset=True, anonymized_telemetry=False)
-)
- 
-# Session configuration
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-app.config['SESSION_TYPE'] = 'filesystem'
-app.config['SESSION_FILE_DIR'] = tempfile.mkdtemp()
-app.config['SESSION_PERMANENT'] = True
-app.config['SESSION_USE_SIGNER'] = True
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=10)
-Session(app)
- 
-# Configure JWT
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')
-jwt = JWTManager(app)
- 
-# Configure PostgreSQL database
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql+psycopg2://postgres:postgres@db:5432/buc_users'
- 
-# Initialize extensions
-init_extensions(app)
- 
-# Initialize Flask-Migrate
-migrate = Migrate(app, db)
- 
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
- 
-# Register Blueprints
-app.register_blueprint(ragapp_bp, url_prefix='/api')
-app.register_blueprint(user_bp, url_prefix='/api')
-app.register_blueprint(auth_bp, url_prefix='/api')
-app.register_blueprint(chroma_bp, url_prefix='/api')
- 
-# Handle OPTIONS requests for all endpoints
-@app.before_request
-def handle_options_request():
-    if request.method == 'OPTIONS':
-        response = jsonify({"status": "ok"})
+
+
+def create_app():
+    """Application factory used by gunicorn (src/wsgi.py), the Flask CLI and the dev server."""
+    # Initialize Flask app
+    app = Flask(__name__)
+
+    # Configure CORS for all routes
+    CORS(app, resources={
+        r"/*": {
+            "origins": ["http://localhost:3000", "http://127.0.0.1:3000"],
+            "methods": ["GET", "POST", "OPTIONS"],
+            "allow_headers": ["Content-Type", "Authorization"],
+            "supports_credentials": True
+        }
+    })
+
+    # Session configuration
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+    app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production
+    app.config['SESSION_COOKIE_HTTPONLY'] = True
+    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+    app.config['SESSION_TYPE'] = 'filesystem'
+    app.config['SESSION_FILE_DIR'] = tempfile.mkdtemp()
+    app.config['SESSION_PERMANENT'] = True
+    app.config['SESSION_USE_SIGNER'] = True
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=10)
+    Session(app)
+
+    # Configure JWT
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')
+
+    # Configure PostgreSQL database
+    app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(DATABASE_URL)
+
+    # Initialize extensions (SQLAlchemy, limiter, JWT, Flask-Migrate)
+    init_extensions(app)
+
+    # Chat turns and feedback are committed by a background writer (ragapp/persistence.py)
+    write_behind.init_app(app)
+
+    # Register Blueprints
+    app.register_blueprint(ragapp_bp, url_prefix='/api')
+    app.register_blueprint(user_bp, url_prefix='/api')
+    app.register_blueprint(auth_bp, url_prefix='/api')
+    app.register_blueprint(chroma_bp, url_prefix='/api')
+
+    # Handle OPTIONS requests for all endpoints
+    @app.before_request
+    def handle_options_request():
+        if request.method == 'OPTIONS':
+            response = jsonify({"status": "ok"})
+            origin = request.headers.get('Origin')
+            allowed_origins = ["http://localhost:3000", "http://127.0.0.1:3000"]
+            if origin in allowed_origins:
+                response.headers.add('Access-Control-Allow-Origin', origin)
+            else:
+                response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
+            response.headers.add('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+            response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+            response.headers.add('Access-Control-Allow-Credentials', 'true')
+            return response, 200
+
+    # FIX: Removed duplicate 404 handler and fixed status code typo (was returning 40)
+    @app.errorhandler(404)
+    def not_found(error):
+        response = jsonify({"error": "Not Found", "message": "The requested API endpoint does not exist."})
         origin = request.headers.get('Origin')
         allowed_origins = ["http://localhost:3000", "http://127.0.0.1:3000"]
         if origin in allowed_origins:
             response.headers.add('Access-Control-Allow-Origin', origin)
         else:
             response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
-        response.headers.add('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        response.headers.add('Access-Control-Allow-Credentials', 'true')
-        return response, 200
- 
-# FIX: Removed duplicate 404 handler and fixed status code typo (was returning 40)
-@app.errorhandler(404)
-def not_found(error):
-    response = jsonify({"error": "Not Found", "message": "The requested API endpoint does not exist."})
-    origin = request.headers.get('Origin')
-    allowed_origins = ["http://localhost:3000", "http://127.0.0.1:3000"]
-    if origin in allowed_origins:
-        response.headers.add('Access-Control-Allow-Origin', origin)
-    else:
-        response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
-    return response, 404
- 
-@app.errorhandler(RateLimitExceeded)
-def ratelimit_handler(e):
-    return jsonify({"error": "Rate limit exceeded. Try again later."}), 429
- 
-# Create database schema
-with app.app_context():
-    # db.drop_all()  # Drop existing tables
-    db.create_all()  # Create new schema
-    print("Database schema created successfully!")
- 
+        return response, 404
+
+    @app.errorhandler(RateLimitExceeded)
+    def ratelimit_handler(e):
+        return jsonify({"error": "Rate limit exceeded. Try again later."}), 429
+
+    @app.cli.command("init-db")
+    def init_db_command():
+        """Create the database schema."""
+        init_db(app)
+
+    # Load the reranker and sentence-transformer weights now; under gunicorn's preload_app
+    # this happens once in the master and workers share the pages copy-on-write
+    if PRELOAD_MODELS:
+        get_response_llm()
+
+    return app
+
+
+def engine_options(database_url):
+    """Connection pool settings from config.py (SQLite keeps SQLAlchemy's default pool)."""
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if not database_url.startswith("sqlite"):
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return options
+
+
+def init_db(app):
+    """Create database schema (kept out of the import path; run once per deployment)."""
+    with app.app_context():
+        # db.drop_all()  # Drop existing tables
+        db.create_all()  # Create new schema
+        print("Database schema created successfully!")
+
+
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
+    app = create_app()
+    init_db(app)
+    start_warmup()
+    app.run(host='0.0.0.0', port=8000, debug=True)
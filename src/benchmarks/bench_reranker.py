@@ -0,0 +1,69 @@
+"""Compare the PyTorch and ONNX reranker backends on latency and ranking agreement.
+
+Usage (from the repository root):
+    python src/benchmarks/bench_reranker.py --docs 30 --rounds 20
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ragapp.reranker import TorchReranker, OnnxReranker  # noqa: E402
+
+QUERIES = [
+    "How do I apply for graduate assistantships?",
+    "What are the library hours during finals week?",
+    "Where can I find the academic calendar?",
+    "How do I register for classes?",
+    "What scholarships are available for international students?",
+]
+
+
+def sample_documents(count):
+    topics = ["tuition", "housing", "library", "registration", "financial aid", "parking", "advising"]
+    return [
+        f"Information about {topics[i % len(topics)]} for students, section {i}: deadlines, offices and contacts."
+        for i in range(count)
+    ]
+
+
+def time_backend(backend, pairs, rounds):
+    backend.predict(pairs)  # Warm up
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        backend.predict(pairs)
+        timings.append(time.perf_counter() - start)
+    return np.median(timings) * 1000, np.percentile(timings, 95) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=30, help="Documents reranked per query")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--top", type=int, default=5, help="Cut-off used for the top-k overlap")
+    args = parser.parse_args()
+
+    documents = sample_documents(args.docs)
+    backends = [TorchReranker(), OnnxReranker(quantize=False), OnnxReranker(quantize=True)]
+    labels = ["torch", "onnx-fp32", "onnx-int8"]
+
+    for query in QUERIES:
+        pairs = [(query, doc) for doc in documents]
+        reference_scores = np.array(backends[0].predict(pairs))
+        reference = np.argsort(-reference_scores)[:args.top]
+        for label, backend in zip(labels, backends):
+            median_ms, p95_ms = time_backend(backend, pairs, args.rounds)
+            scores = np.array(backend.predict(pairs))
+            top = np.argsort(-scores)[:args.top]
+            overlap = len(set(top) & set(reference)) / args.top
+            max_diff = np.abs(scores - reference_scores).max()
+            print(f"{label:10s} median={median_ms:7.1f}ms p95={p95_ms:7.1f}ms top{args.top}-overlap={overlap:.2f} "
+                  f"max-diff={max_diff:.4f}  {query}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Compare vector lookups through the Chroma HTTP server with the in-process local index.
+
+Queries are stored chunk embeddings with a little noise, so no OpenAI calls are made.
+Run the ingestion job with VECTOR_BACKEND=local first so the local index exists.
+
+Usage (from the repository root):
+    python src/benchmarks/bench_vector_backends.py --queries 200 --top-k 10
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import chromadb  # noqa: E402
+from chromadb.config import Settings  # noqa: E402
+from config import COLLECTION_NAME, CHROMA_HOST, CHROMA_PORT  # noqa: E402
+from chromvec.localindex import LocalVectorIndex  # noqa: E402
+
+
+def timed(func, queries):
+    timings, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(func(query))
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    return results, np.median(timings), np.percentile(timings, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.01)
+    args = parser.parse_args()
+
+    local_index = LocalVectorIndex.load()
+    if local_index is None or not len(local_index):
+        sys.exit("No local index found; run the ingestion job with VECTOR_BACKEND=local first.")
+
+    client = chromadb.HttpClient(
+        host=CHROMA_HOST, port=CHROMA_PORT, settings=Settings(anonymized_telemetry=False)
+    )
+    collection = client.get_collection(COLLECTION_NAME)
+
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(local_index), size=min(args.queries, len(local_index)), replace=False)
+    queries = [
+        (np.asarray(local_index.vectors[row]) + rng.normal(0, args.noise, local_index.vectors.shape[1])).tolist()
+        for row in rows
+    ]
+
+    chroma_results, chroma_median, chroma_p95 = timed(
+        lambda query: collection.query(query_embeddings=[query], n_results=args.top_k)["ids"][0], queries
+    )
+    local_results, local_median, local_p95 = timed(
+        lambda query: local_index.query([query], args.top_k)["ids"][0], queries
+    )
+
+    overlap = np.mean([
+        len(set(chroma) & set(local)) / args.top_k for chroma, local in zip(chroma_results, local_results)
+    ])
+    print(f"{len(local_index)} vectors, {len(queries)} queries, top-{args.top_k}")
+    print(f"chroma (HTTP)  median={chroma_median:8.3f}ms  p95={chroma_p95:8.3f}ms")
+    print(f"local (numpy)  median={local_median:8.3f}ms  p95={local_p95:8.3f}ms")
+    print(f"top-{args.top_k} overlap between backends: {overlap:.3f}")
+
+
+if __name__ == "__main__":
+    main()
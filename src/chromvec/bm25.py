@@ -0,0 +1,144 @@
+import os
+import re
+import math
+import json
+import logging
+import threading
+from collections import Counter
+from config import BM25_INDEX_PATH, BM25_K1, BM25_B, COLLECTION_NAME
+
+logger = logging.getLogger(__name__)
+
+# Words joined by "-" or "." stay together ("csci-1100", "423-439-4317", "ext.5"), and the parts are indexed too
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-.][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or the to what when where which who "
+    "will with you your".split()
+)
+
+
+def tokenize(text):
+    """Lowercased terms; compound tokens are emitted whole, glued together and split into parts."""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        terms.append(token)
+        parts = re.split(r"[-.]", token)
+        if len(parts) > 1:
+            terms.append("".join(parts))
+            terms.extend(part for part in parts if part not in STOPWORDS)
+    return terms
+
+
+class BM25Index:
+    """In-process BM25 inverted index over the same chunks (and ids) stored in Chroma.
+
+    Chunk text and metadata are kept alongside the postings so lexical-only hits can be
+    reranked without another round-trip to the vector store.
+    """
+
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.index_version = None
+        self.chunks = {}  # chunk id -> {"document", "metadata", "length"}
+        self.postings = {}  # term -> {chunk id: term frequency}
+        self.total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.chunks
+
+    def add(self, chunk_id, document, metadata):
+        with self._lock:
+            if chunk_id in self.chunks:
+                self.remove(chunk_id)
+            frequencies = Counter(tokenize(f"{metadata.get('document_title', '')}\n{document}"))
+            for term, count in frequencies.items():
+                self.postings.setdefault(term, {})[chunk_id] = count
+            length = sum(frequencies.values())
+            self.chunks[chunk_id] = {"document": document, "metadata": metadata, "length": length}
+            self.total_length += length
+
+    def remove(self, chunk_id):
+        with self._lock:
+            chunk = self.chunks.pop(chunk_id, None)
+            if chunk is None:
+                return
+            self.total_length -= chunk["length"]
+            for term in set(tokenize(f"{chunk['metadata'].get('document_title', '')}\n{chunk['document']}")):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self.postings[term]
+
+    def get(self, chunk_id):
+        chunk = self.chunks.get(chunk_id)
+        return (chunk["document"], chunk["metadata"]) if chunk else (None, None)
+
+    def search(self, query, top_k):
+        """Return up to top_k (chunk id, score) pairs, best first."""
+        with self._lock:
+            count = len(self.chunks)
+            if not count:
+                return []
+            average_length = self.total_length / count
+            scores = {}
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.chunks[chunk_id]["length"] / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def save(self, path=BM25_INDEX_PATH):
+        """Atomically persist the chunks; postings are rebuilt on load."""
+        with self._lock:
+            payload = {
+                "collection": COLLECTION_NAME,
+                "index_version": self.index_version,
+                "chunks": {cid: {"document": c["document"], "metadata": c["metadata"]} for cid, c in self.chunks.items()}
+            }
+        dir_path = os.path.dirname(path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(payload, file)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=BM25_INDEX_PATH):
+        """Load a saved index, or return an empty one if it is missing, unreadable or for another collection."""
+        index = cls()
+        if not os.path.exists(path):
+            return index
+        try:
+            with open(path, 'r') as file:
+                payload = json.load(file)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable BM25 index {path}: {e}")
+            return index
+        if payload.get("collection") != COLLECTION_NAME:
+            return index
+        for chunk_id, chunk in payload["chunks"].items():
+            index.add(chunk_id, chunk["document"], chunk["metadata"])
+        index.index_version = payload.get("index_version")
+        return index
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse ranked id lists; returns ids ordered by sum(1 / (k + rank))."""
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -1,12 +1,20 @@
 import os
 import json
-import uuid
+import time
+import random
 import logging
-import chromadb
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import tiktoken  # OpenAI tokenizer
-from chromadb.config import Settings
-from chromadb.utils import embedding_functions
-from config import EMBEDDING_MODEL_NAME, COLLECTION_NAME, OPENAI_API_KEY, JSON_FILE_PATH
+from config import (
+    EMBEDDING_MODEL_NAME, JSON_FILE_PATH,
+    EMBED_BATCH_MAX_TOKENS, EMBED_BATCH_MAX_ITEMS, EMBED_MAX_CONCURRENCY,
+    EMBED_MAX_RETRIES, EMBED_RETRY_BASE_DELAY, VECTOR_BACKEND
+)
+from .embedcache import get_embedding_function
+from .manifest import content_hash, chunk_id, empty_manifest, load_manifest, save_manifest, new_index_version
+from .bm25 import BM25Index
+from .localindex import export_local_index, local_index_version
+from .store import get_vector_store
 
 # Constants
 MAX_TOKENS = 1000  # Safe token limit
@@ -26,18 +34,8 @@ logger = logging.getLogger(__name__)
 # Define JSON path
 json_path = os.path.join(JSON_FILE_PATH)
 
-# Initialize ChromaDB HTTP client
-chroma_client = chroma_client = chromadb.HttpClient(
-    host="chroma-container",
-    port=8000,
-    settings=Settings(allow_reset=True, anonymized_telemetry=False)
-)
-
-# Initialize OpenAI embedding function
-openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-    api_key=OPENAI_API_KEY,
-    model_name=EMBEDDING_MODEL_NAME
-)
+# Initialize OpenAI embedding function (cached, shared with the retriever)
+openai_ef = get_embedding_function()
 
 # Initialize tokenizer
 tokenizer = tiktoken.encoding_for_model(EMBEDDING_MODEL_NAME)
@@ -54,58 +52,252 @@ def split_by_token_limit(text, max_tokens=MAX_TOKENS, overlap=CHUNK_OVERLAP):
 
     return chunks
 
+# Page size used when listing ids or deleting stale chunks
+ID_PAGE_SIZE = 1000
+
+
+def group_documents(data):
+    """Group JSON items by document link so each document is fingerprinted once."""
+    documents = {}
+    for item in data:
+        text_data = item.get('document_content', '')
+        if not text_data.strip():
+            continue
+        link = item.get('document_link') or item.get('document_title') or 'No link available'
+        documents.setdefault(link, []).append(item)
+    return documents
+
+
+def build_chunk_records(document_link, items):
+    """Split a document's items into token-safe chunks with deterministic ids, metadata and token counts."""
+    records = []
+    chunk_index = 0
+    for item in items:
+        title = item.get('document_title', 'No title')
+        for chunk in split_by_token_limit(item.get('document_content', '')):
+            # Title is part of the fingerprint so metadata edits are re-indexed too
+            records.append({
+                "id": chunk_id(document_link, chunk_index, content_hash(f"{title}\n{chunk}")),
+                "document": chunk,
+                "metadata": {
+                    "document_title": title,
+                    "document_link": item.get('document_link', 'No link available'),
+                    "chunk_index": chunk_index
+                },
+                "tokens": len(tokenizer.encode(chunk))
+            })
+            chunk_index += 1
+    return records
+
+
+def document_hash(items):
+    """Fingerprint of everything that ends up in a document's chunks."""
+    return content_hash("\x1e".join(
+        f"{item.get('document_title', '')}\x1f{item.get('document_content', '')}" for item in items
+    ))
+
+
+def list_collection_ids(collection):
+    """Page through every id currently stored in the collection."""
+    ids = set()
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=ID_PAGE_SIZE, offset=offset)
+        ids.update(page["ids"])
+        if len(page["ids"]) < ID_PAGE_SIZE:
+            return ids
+        offset += ID_PAGE_SIZE
+
+
+def delete_ids(collection, ids):
+    ids = list(ids)
+    for i in range(0, len(ids), ID_PAGE_SIZE):
+        collection.delete(ids=ids[i:i + ID_PAGE_SIZE])
+
+
+def batch_by_token_budget(records, max_tokens=EMBED_BATCH_MAX_TOKENS, max_items=EMBED_BATCH_MAX_ITEMS):
+    """Group chunk records into batches that stay under the embedding request limits."""
+    batch = []
+    batch_tokens = 0
+    for record in records:
+        if batch and (batch_tokens + record["tokens"] > max_tokens or len(batch) >= max_items):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(record)
+        batch_tokens += record["tokens"]
+    if batch:
+        yield batch
+
+
+def embed_and_upsert_batch(collection, batch, max_retries=EMBED_MAX_RETRIES, base_delay=EMBED_RETRY_BASE_DELAY):
+    """Embed a batch in one request and upsert it into ChromaDB, retrying with exponential backoff."""
+    documents = [record["document"] for record in batch]
+    for attempt in range(1, max_retries + 1):
+        try:
+            embeddings = openai_ef(documents)
+            collection.upsert(
+                embeddings=embeddings,
+                documents=documents,
+                ids=[record["id"] for record in batch],
+                metadatas=[record["metadata"] for record in batch]
+            )
+            return len(batch)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = base_delay * (2 ** (attempt - 1)) + random.uniform(0, base_delay)
+            logger.warning(f"Batch of {len(batch)} chunks failed (attempt {attempt}/{max_retries}): {e}. "
+                           f"Retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def push_batches(collection, batches, max_concurrency=EMBED_MAX_CONCURRENCY):
+    """Run embed_and_upsert_batch over all batches, keeping at most max_concurrency batches in flight.
+
+    Returns (added_count, failed_batches) where failed_batches holds (batch, error) pairs
+    for batches that exhausted their retries.
+    """
+    added = 0
+    failed_batches = []
+    in_flight = {}
+    batches = iter(batches)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        while True:
+            # Top up the pool without materialising every batch up front
+            while len(in_flight) < max_concurrency:
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                in_flight[executor.submit(embed_and_upsert_batch, collection, batch)] = batch
+
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = in_flight.pop(future)
+                try:
+                    added += future.result()
+                    logger.info(f"Upserted batch of {len(batch)} chunks ({added} total)")
+                except Exception as e:
+                    logger.error(f"Batch of {len(batch)} chunks failed permanently: {e}")
+                    failed_batches.append((batch, e))
+
+    return added, failed_batches
+
+
+def sync_bm25_index(documents, manifest, records_by_link):
+    """Bring the persisted BM25 index in line with the chunks listed in the manifest."""
+    index = BM25Index.load()
+    keep_ids = set()
+    for link, entry in manifest["documents"].items():
+        chunk_ids = set(entry["chunk_ids"])
+        keep_ids.update(chunk_ids)
+        if link not in documents or all(cid in index for cid in chunk_ids):
+            continue
+        records = records_by_link.get(link) or build_chunk_records(link, documents[link])
+        for record in records:
+            if record["id"] in chunk_ids:
+                index.add(record["id"], record["document"], record["metadata"])
+
+    stale_ids = [cid for cid in index.chunks if cid not in keep_ids]
+    for cid in stale_ids:
+        index.remove(cid)
+    index.index_version = manifest["index_version"]
+    index.save()
+    logger.info(f"BM25 index holds {len(index)} chunks ({len(stale_ids)} removed)")
+
+
 def process_and_push_data_to_chromadb():
-    """Reset collection and push JSON data to ChromaDB in token-safe chunks."""
+    """Incrementally sync the JSON data into ChromaDB.
+
+    Only chunks whose deterministic id is not already indexed are embedded, chunks that no
+    longer exist are deleted, and unchanged documents are skipped entirely. The collection
+    is never dropped, so retrieval keeps working while the sync runs.
+    """
     try:
         # Test connection
-        heartbeat = chroma_client.heartbeat()
+        store = get_vector_store()
+        heartbeat = store.heartbeat()
         logger.debug(f"ChromaDB heartbeat response: {heartbeat}")
 
-        # Delete existing collection
-        chroma_client.delete_collection(COLLECTION_NAME)
-        logger.info(f"Deleted existing collection: {COLLECTION_NAME}")
-
-        # Recreate collection
-        collection = chroma_client.get_or_create_collection(
-            name=COLLECTION_NAME,
-            embedding_function=openai_ef
-        )
-        logger.info(f"Recreated collection: {COLLECTION_NAME}")
+        collection = store.get_or_create_collection(embedding_function=openai_ef)
 
         # Load data
         with open(json_path, 'r') as file:
             data = json.load(file)
         logger.info("Loaded %d items from JSON file", len(data))
 
-        # Process and add each document
-        for item in data:
-            text_data = item.get('document_content', '')
-            if not text_data.strip():
+        previous = load_manifest()
+        if previous is None:
+            # No usable manifest: diff against whatever the collection holds (e.g. legacy uuid ids)
+            previous = empty_manifest()
+            indexed_ids = list_collection_ids(collection)
+            logger.info(f"No manifest found; {len(indexed_ids)} chunks currently in collection")
+        else:
+            indexed_ids = {cid for doc in previous["documents"].values() for cid in doc["chunk_ids"]}
+
+        documents = group_documents(data)
+        planned = {}
+        records_by_link = {}
+        records_to_embed = []
+        unchanged = 0
+        for link, items in documents.items():
+            doc_hash = document_hash(items)
+            known = previous["documents"].get(link)
+            if known and known["content_hash"] == doc_hash:
+                planned[link] = known
+                unchanged += 1
                 continue
 
-            chunks = split_by_token_limit(text_data)
+            records = build_chunk_records(link, items)
+            records_by_link[link] = records
+            planned[link] = {"content_hash": doc_hash, "chunk_ids": [r["id"] for r in records]}
+            records_to_embed.extend(r for r in records if r["id"] not in indexed_ids)
 
-            for i, chunk in enumerate(chunks):
-                doc_id = f"{uuid.uuid4()}_{i}"
-                metadata = {
-                    "document_title": item.get('document_title', 'No title'),
-                    "document_link": item.get('document_link', 'No link available'),
-                    "chunk_index": i
-                }
+        logger.info(f"{len(documents)} documents: {unchanged} unchanged, "
+                    f"{len(records_to_embed)} new or changed chunks to embed")
 
-                try:
-                    embedding = openai_ef([chunk])
-                    collection.add(
-                        embeddings=embedding,
-                        documents=[chunk],
-                        ids=[doc_id],
-                        metadatas=[metadata]
-                    )
-                    logger.info("Chunk %d added with ID %s", i, doc_id)
-                except Exception as embed_err:
-                    logger.error(f"Embedding failed for chunk {i}: {embed_err}")
-
-        return f"Successfully embedded documents with token-aware splitting."
+        added, failed_batches = push_batches(collection, batch_by_token_budget(records_to_embed))
+
+        # Documents with failed chunks keep their previous manifest entry (and old chunks) so the next run retries them
+        failed_ids = {record["id"] for batch, _ in failed_batches for record in batch}
+        manifest = empty_manifest()
+        manifest["index_version"] = previous.get("index_version")
+        for link, entry in planned.items():
+            if failed_ids.intersection(entry["chunk_ids"]):
+                if link in previous["documents"]:
+                    manifest["documents"][link] = previous["documents"][link]
+            else:
+                manifest["documents"][link] = entry
+
+        keep_ids = {cid for entry in planned.values() for cid in entry["chunk_ids"]}
+        keep_ids.update(cid for doc in manifest["documents"].values() for cid in doc["chunk_ids"])
+        stale_ids = indexed_ids - keep_ids
+        delete_ids(collection, stale_ids)
+        logger.info(f"Deleted {len(stale_ids)} stale chunks")
+
+        # Derived indexes are written under the new version before the manifest announces it, so a
+        # worker that sees the new version never loads (and caches) the previous BM25 or vector files
+        if added or stale_ids or not manifest["index_version"]:
+            manifest["index_version"] = new_index_version()
+        sync_bm25_index(documents, manifest, records_by_link)
+        if VECTOR_BACKEND == "local" and local_index_version() != manifest["index_version"]:
+            export_local_index(collection, manifest["index_version"])
+        save_manifest(manifest, bump_version=False)
+
+        if failed_batches:
+            logger.error(f"{len(failed_ids)} chunks were not embedded: {sorted(failed_ids)}")
+            raise RuntimeError(
+                f"Embedded {added} of {len(records_to_embed)} chunks; {len(failed_batches)} batches "
+                f"({len(failed_ids)} chunks) failed after {EMBED_MAX_RETRIES} attempts. "
+                f"Last error: {failed_batches[-1][1]}"
+            )
+
+        return (f"Indexed {len(documents)} documents: {added} chunks embedded, "
+                f"{len(stale_ids)} removed, {unchanged} documents unchanged.")
 
     except FileNotFoundError:
         logger.error("Input file not found")
@@ -0,0 +1,220 @@
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+import numpy as np
+from cachetools import LRUCache
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from chromadb.utils import embedding_functions
+from config import (
+    OPENAI_API_KEY, EMBEDDING_MODEL_NAME, EMBEDDING_CACHE_MEMORY_SIZE,
+    EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_DISK_MAX_ENTRIES
+)
+
+logger = logging.getLogger(__name__)
+
+# A hit only rewrites last_used when the stored value is older than this; LRU order at this
+# granularity is plenty for eviction and keeps reads from turning into writes
+LAST_USED_REFRESH_SECONDS = 600
+# Eviction trims the table to this fraction of max_entries so it runs once per many inserts
+EVICT_TO_FRACTION = 0.9
+
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different inputs share a cache entry."""
+    return " ".join(text.split())
+
+
+class EmbeddingDiskCache:
+    """SQLite store of float32 embeddings, evicting least recently used rows past max_entries.
+
+    Each process keeps an approximate row count so eviction only runs once the table is
+    over the limit.
+    """
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        dir_path = os.path.dirname(path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._entries = 0
+        with self._lock:
+            self._connection()
+
+    def _connection(self):
+        # SQLite handles must not cross a fork, so each process opens its own
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+            self._conn.commit()
+            self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._pid = os.getpid()
+        return self._conn
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                f"SELECT key, vector, last_used FROM embeddings WHERE key IN ({placeholders})", keys
+            ).fetchall()
+            now = time.time()
+            stale = [key for key, _, last_used in rows if last_used < now - LAST_USED_REFRESH_SECONDS]
+            if stale:
+                conn.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE key IN ({','.join('?' * len(stale))})",
+                    [now] + stale
+                )
+                conn.commit()
+        return {key: np.frombuffer(vector, dtype=np.float32) for key, vector, _ in rows}
+
+    def put_many(self, items):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, vector.tobytes(), now) for key, vector in items]
+            )
+            # Replaced keys and other processes' writes make the count approximate; it is
+            # re-read whenever it says the table may be full
+            self._entries += len(items)
+            if self._entries > self.max_entries:
+                self._entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if self._entries > self.max_entries:
+                keep = int(self.max_entries * EVICT_TO_FRACTION)
+                conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (keep,)
+                )
+                self._entries = min(self._entries, keep)
+            conn.commit()
+
+
+class CachedEmbeddingFunction(EmbeddingFunction[Documents]):
+    """Chroma embedding function that consults an in-process LRU, then SQLite, before calling the wrapped function.
+
+    Entries are keyed by (model name, hash of whitespace-normalised text).
+    """
+
+    def __init__(self, embedding_function, model_name, memory_size=EMBEDDING_CACHE_MEMORY_SIZE,
+                 disk_path=EMBEDDING_CACHE_PATH, disk_max_entries=EMBEDDING_CACHE_DISK_MAX_ENTRIES):
+        self.embedding_function = embedding_function
+        self.model_name = model_name
+        self._memory = LRUCache(maxsize=memory_size)
+        self._lock = threading.Lock()
+        self._disk = None
+        if disk_path:
+            try:
+                self._disk = EmbeddingDiskCache(disk_path, disk_max_entries)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Embedding disk cache unavailable at {disk_path}: {e}")
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def cache_key(self, text):
+        return hashlib.sha256(f"{self.model_name}\x00{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+    def _lookup(self, input):
+        """Returns (keys, found, missing): cached vectors by key and the texts that still need embedding."""
+        keys = [self.cache_key(text) for text in input]
+        found = {}
+
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    found[key] = vector
+            self.counters["memory_hits"] += sum(1 for key in keys if key in found)
+
+        pending = [key for key in dict.fromkeys(keys) if key not in found]
+        if pending and self._disk is not None:
+            try:
+                disk_hits = self._disk.get_many(pending)
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding disk cache read failed: {e}")
+                disk_hits = {}
+            found.update(disk_hits)
+            with self._lock:
+                self.counters["disk_hits"] += sum(1 for key in keys if key in disk_hits)
+                for key, vector in disk_hits.items():
+                    self._memory[key] = vector
+
+        missing = {}
+        for key, text in zip(keys, input):
+            if key not in found:
+                missing.setdefault(key, text)
+        return keys, found, missing
+
+    def _store(self, keys, found, missing, vectors):
+        fresh = [(key, np.asarray(vector, dtype=np.float32)) for key, vector in zip(missing, vectors)]
+        found.update(fresh)
+        with self._lock:
+            self.counters["misses"] += sum(1 for key in keys if key in missing)
+            for key, vector in fresh:
+                self._memory[key] = vector
+        if self._disk is not None:
+            try:
+                self._disk.put_many(fresh)
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding disk cache write failed: {e}")
+
+    def __call__(self, input: Documents) -> Embeddings:
+        keys, found, missing = self._lookup(input)
+        if missing:
+            self._store(keys, found, missing, self.embedding_function(list(missing.values())))
+        return [found[key].tolist() for key in keys]
+
+    async def acall(self, input, embed_texts):
+        """Async variant of __call__; embed_texts is a coroutine function used for the misses.
+
+        The cache lookups and writes block on SQLite, so they run in the default executor
+        rather than on the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        keys, found, missing = await loop.run_in_executor(None, self._lookup, input)
+        if missing:
+            vectors = await embed_texts(list(missing.values()))
+            await loop.run_in_executor(None, self._store, keys, found, missing, vectors)
+        return [found[key].tolist() for key in keys]
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters["memory_entries"] = len(self._memory)
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+        counters["hit_rate"] = round((lookups - counters["misses"]) / lookups, 4) if lookups else 0.0
+        return counters
+
+
+_embedding_function = None
+_embedding_function_lock = threading.Lock()
+
+
+def get_embedding_function():
+    """Process-wide cached OpenAI embedding function shared by ingestion and retrieval."""
+    global _embedding_function
+    with _embedding_function_lock:
+        if _embedding_function is None:
+            _embedding_function = CachedEmbeddingFunction(
+                embedding_functions.OpenAIEmbeddingFunction(
+                    api_key=OPENAI_API_KEY,
+                    model_name=EMBEDDING_MODEL_NAME
+                ),
+                model_name=EMBEDDING_MODEL_NAME
+            )
+    return _embedding_function
@@ -0,0 +1,127 @@
+import os
+import json
+import logging
+import numpy as np
+from config import LOCAL_INDEX_DIR, COLLECTION_NAME
+
+logger = logging.getLogger(__name__)
+
+CHUNKS_FILE = "chunks.json"
+EXPORT_PAGE_SIZE = 500
+
+
+class LocalVectorIndex:
+    """Read-only copy of the collection's embeddings for in-process exact search.
+
+    Vectors are L2-normalized and stored as a float32 .npy file that is memory-mapped, so
+    gunicorn workers share the pages. chunks.json names the current vector file; the
+    ingestion job writes a new versioned file and swaps chunks.json atomically.
+    """
+
+    def __init__(self, ids, documents, metadatas, vectors, index_version):
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.vectors = vectors
+        self.index_version = index_version
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query(self, query_embeddings, n_results):
+        """Cosine top-n by exact dot product, shaped like a Chroma query result."""
+        queries = np.array(query_embeddings, dtype=np.float32, ndmin=2)
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if not self.ids:
+            # An empty export is stored as a (0, 1) placeholder that cannot be multiplied
+            for key in result:
+                result[key] = [[] for _ in queries]
+            return result
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        n_results = min(n_results, len(self.ids))
+        for scores in queries @ self.vectors.T:
+            top = np.argpartition(-scores, n_results - 1)[:n_results] if n_results else []
+            top = sorted(top, key=lambda row: -scores[row])
+            result["ids"].append([self.ids[row] for row in top])
+            result["documents"].append([self.documents[row] for row in top])
+            result["metadatas"].append([self.metadatas[row] for row in top])
+            result["distances"].append([float(1 - scores[row]) for row in top])
+        return result
+
+    @classmethod
+    def load(cls, index_dir=LOCAL_INDEX_DIR):
+        """Load the exported index, or return None if none was exported for this collection."""
+        path = os.path.join(index_dir, CHUNKS_FILE)
+        try:
+            with open(path, 'r') as file:
+                payload = json.load(file)
+            vectors = np.load(os.path.join(index_dir, payload["vectors_file"]), mmap_mode='r')
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Local vector index unavailable in {index_dir}: {e}")
+            return None
+        if payload.get("collection") != COLLECTION_NAME:
+            return None
+        return cls(payload["ids"], payload["documents"], payload["metadatas"], vectors, payload["index_version"])
+
+
+def export_local_index(collection, index_version, index_dir=LOCAL_INDEX_DIR):
+    """Page every embedding out of the Chroma collection and write a new local index version."""
+    ids, documents, metadatas, vectors = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(
+            include=["embeddings", "documents", "metadatas"], limit=EXPORT_PAGE_SIZE, offset=offset
+        )
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+        metadatas.extend(page["metadatas"])
+        vectors.extend(page["embeddings"])
+        if len(page["ids"]) < EXPORT_PAGE_SIZE:
+            break
+        offset += EXPORT_PAGE_SIZE
+
+    matrix = np.asarray(vectors, dtype=np.float32) if ids else np.zeros((0, 1), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1, norms)
+
+    os.makedirs(index_dir, exist_ok=True)
+    vectors_file = f"vectors-{index_version}.npy"
+    np.save(os.path.join(index_dir, vectors_file), matrix)
+
+    path = os.path.join(index_dir, CHUNKS_FILE)
+    previous_file = None
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as file:
+                previous_file = json.load(file).get("vectors_file")
+        except (OSError, ValueError):
+            pass
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump({
+            "collection": COLLECTION_NAME,
+            "index_version": index_version,
+            "vectors_file": vectors_file,
+            "ids": ids,
+            "documents": documents,
+            "metadatas": metadatas
+        }, file)
+    os.replace(tmp_path, path)
+
+    # Workers that still map the old file keep reading it until they reload
+    if previous_file and previous_file != vectors_file:
+        try:
+            os.remove(os.path.join(index_dir, previous_file))
+        except OSError:
+            pass
+    logger.info(f"Exported {len(ids)} vectors to the local index ({index_version})")
+    return len(ids)
+
+
+def local_index_version(index_dir=LOCAL_INDEX_DIR):
+    try:
+        with open(os.path.join(index_dir, CHUNKS_FILE), 'r') as file:
+            return json.load(file).get("index_version")
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,88 @@
+import os
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from config import EMBED_MANIFEST_PATH, COLLECTION_NAME, EMBEDDING_MODEL_NAME
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text):
+    """Stable short hash used for document and chunk fingerprints."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def chunk_id(document_link, chunk_index, chunk_hash):
+    """Deterministic chunk id derived from the document link, chunk position and chunk content."""
+    return f"{content_hash(document_link)}_{chunk_index}_{chunk_hash}"
+
+
+def empty_manifest():
+    return {
+        "collection": COLLECTION_NAME,
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "index_version": None,
+        "updated_at": None,
+        "documents": {}
+    }
+
+
+def load_manifest(path=EMBED_MANIFEST_PATH):
+    """Load the manifest, returning None if it is missing, unreadable or built for another collection/model."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as file:
+            manifest = json.load(file)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Ignoring unreadable manifest {path}: {e}")
+        return None
+
+    if manifest.get("collection") != COLLECTION_NAME or manifest.get("embedding_model") != EMBEDDING_MODEL_NAME:
+        logger.info("Manifest was built for a different collection or embedding model; ignoring it")
+        return None
+    return manifest
+
+
+def new_index_version():
+    return uuid.uuid4().hex
+
+
+def save_manifest(manifest, path=EMBED_MANIFEST_PATH, bump_version=True):
+    """Atomically write the manifest, optionally stamping a new index version."""
+    if bump_version or not manifest.get("index_version"):
+        manifest["index_version"] = new_index_version()
+    manifest["updated_at"] = datetime.utcnow().isoformat()
+
+    dir_path = os.path.dirname(path)
+    if dir_path:
+        os.makedirs(dir_path, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+_version_lock = threading.Lock()
+_version_state = {"mtime": None, "version": None}
+
+
+def current_index_version(path=EMBED_MANIFEST_PATH):
+    """Index version stamped by the last re-index, re-read only when the manifest file changes.
+
+    Caches keyed on collection contents compare against this to invalidate themselves.
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    with _version_lock:
+        if mtime != _version_state["mtime"]:
+            manifest = load_manifest(path)
+            _version_state["mtime"] = mtime
+            _version_state["version"] = manifest.get("index_version") if manifest else None
+        return _version_state["version"]
@@ -0,0 +1,221 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import httpx
+import chromadb
+from chromadb.config import Settings
+from config import (
+    COLLECTION_NAME, CHROMA_HOST, CHROMA_PORT, CHROMA_TIMEOUT_SECONDS, CHROMA_CONNECT_TIMEOUT_SECONDS,
+    CHROMA_MAX_CONNECTIONS, CHROMA_BREAKER_FAILURES, CHROMA_BREAKER_RESET_SECONDS
+)
+from .manifest import current_index_version
+
+logger = logging.getLogger(__name__)
+
+
+class VectorStoreUnavailable(RuntimeError):
+    """Raised without calling Chroma while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures and fails fast for reset_seconds.
+
+    Once the reset time has passed a single trial call is let through (half-open); its
+    outcome closes the circuit again or re-opens it.
+    """
+
+    def __init__(self, failure_threshold=CHROMA_BREAKER_FAILURES, reset_seconds=CHROMA_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self.counters = {"failures": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self.counters["rejected"] += 1
+        raise VectorStoreUnavailable("ChromaDB circuit is open; failing fast")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self.counters["failures"] += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial_in_flight:
+                    self.counters["opened"] += 1
+                    logger.warning(f"ChromaDB circuit opened after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, state=self.state, consecutive_failures=self._failures)
+
+
+class VectorStore:
+    """Single access layer for the Chroma server.
+
+    Holds one sync and one async client per process, both on keep-alive connection pools
+    with bounded timeouts, caches the collection handle until the index version changes,
+    and routes retrieval calls through a circuit breaker.
+    """
+
+    def __init__(self, host=CHROMA_HOST, port=CHROMA_PORT, timeout=CHROMA_TIMEOUT_SECONDS,
+                 connect_timeout=CHROMA_CONNECT_TIMEOUT_SECONDS, max_connections=CHROMA_MAX_CONNECTIONS):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.breaker = CircuitBreaker()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._client = None
+        self._collection = None
+        self._async_client = None
+        self._async_collection = None
+
+    def _settings(self):
+        return Settings(allow_reset=True, anonymized_telemetry=False)
+
+    def _reset_after_fork(self):
+        if self._pid != os.getpid():
+            self._client = None
+            self._collection = None
+            self._async_client = None
+            self._async_collection = None
+            self._pid = os.getpid()
+
+    def client(self):
+        """Sync HTTP client for this process; chromadb's own session is swapped for a pooled one with timeouts."""
+        with self._lock:
+            self._reset_after_fork()
+            if self._client is None:
+                client = chromadb.HttpClient(host=self.host, port=self.port, settings=self._settings())
+                server = getattr(client, "_server", None)
+                if isinstance(getattr(server, "_session", None), httpx.Client):
+                    headers = server._session.headers
+                    server._session = httpx.Client(
+                        timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                        limits=httpx.Limits(
+                            max_connections=self.max_connections, max_keepalive_connections=self.max_connections
+                        ),
+                        headers=headers
+                    )
+                self._client = client
+            return self._client
+
+    def collection(self):
+        """Cached handle to the main collection, refreshed when the collection is re-indexed.
+
+        Not guarded itself, like acollection: callers fetch it inside the guarded call that
+        uses it, so one failure counts once against the breaker.
+        """
+        version = current_index_version()
+        cached = self._collection
+        if cached is None or cached[0] != version:
+            collection = self.client().get_collection(COLLECTION_NAME)
+            with self._lock:
+                self._collection = (version, collection)
+            return collection
+        return cached[1]
+
+    def get_or_create_collection(self, embedding_function=None):
+        """Used by ingestion; not cached because it may create the collection."""
+        return self.client().get_or_create_collection(name=COLLECTION_NAME, embedding_function=embedding_function)
+
+    def heartbeat(self):
+        return self._guarded(lambda: self.client().heartbeat())
+
+    def count(self):
+        return self._guarded(lambda: self.collection().count())
+
+    def get(self, **kwargs):
+        return self._guarded(lambda: self.collection().get(**kwargs))
+
+    def _guarded(self, call):
+        self.breaker.before_call()
+        try:
+            result = call()
+        except BaseException:
+            self.breaker.record_failure()
+            self._collection = None
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def _aclient(self):
+        with self._lock:
+            self._reset_after_fork()
+            client = self._async_client
+        if client is None:
+            # chromadb keeps one pooled httpx.AsyncClient per event loop inside this client
+            client = await chromadb.AsyncHttpClient(host=self.host, port=self.port, settings=self._settings())
+            with self._lock:
+                self._async_client = client
+        return client
+
+    async def acollection(self):
+        version = current_index_version()
+        cached = self._async_collection
+        if cached is None or cached[0] != version:
+            client = await self._aclient()
+            collection = await client.get_collection(COLLECTION_NAME)
+            self._async_collection = (version, collection)
+            return collection
+        return cached[1]
+
+    async def aquery(self, query_embeddings, n_results):
+        """Vector query with the configured timeout, guarded by the circuit breaker."""
+        self.breaker.before_call()
+        try:
+            collection = await asyncio.wait_for(self.acollection(), self.timeout)
+            result = await asyncio.wait_for(
+                collection.query(query_embeddings=query_embeddings, n_results=n_results), self.timeout
+            )
+        except BaseException:
+            # Includes CancelledError from a caller's timeout: a cancelled half-open trial must
+            # still clear the trial flag, or the breaker would reject every later call
+            self.breaker.record_failure()
+            self._async_collection = None
+            raise
+        self.breaker.record_success()
+        return result
+
+    def stats(self):
+        return {"host": f"{self.host}:{self.port}", "breaker": self.breaker.stats()}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_vector_store():
+    """Process-wide VectorStore shared by the retriever, the API views and ingestion."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = VectorStore()
+        return _store
@@ -1,10 +1,10 @@
 # Blueprint setup
-from flask import Blueprint, jsonify
-from flask import Blueprint, jsonify
-from chromadb import HttpClient
-from chromadb.config import Settings
-from config import COLLECTION_NAME
+from flask import Blueprint, jsonify, request, Response, stream_with_context
+from config import DOCUMENTS_PAGE_SIZE, DOCUMENTS_MAX_PAGE_SIZE, DOCUMENTS_STREAM_PAGE_SIZE
 from .embedDoc import process_and_push_data_to_chromadb
+from .manifest import current_index_version
+from .store import get_vector_store
+import json
 import logging
 
 chroma_bp = Blueprint('chroma_bp', __name__)
@@ -13,13 +13,8 @@ chroma_bp = Blueprint('chroma_bp', __name__)
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-
-# ChromaDB setup
-chroma_client = HttpClient(
-    host="chroma-container",
-    port=8000,
-    settings=Settings(allow_reset=True, anonymized_telemetry=False)
-)
+# Chroma include field -> key used in the /documents response
+DOCUMENT_FIELDS = {"documents": "content", "metadatas": "metadata"}
 
 
 @chroma_bp.route('/health', methods=['GET'])
@@ -27,17 +22,12 @@ def health_check():
     """Check if the API and its dependencies are running."""
     try:
         health_status = {"status": "healthy", "message": "API is running"}
-        chroma_client = HttpClient(
-            host="chroma-container",
-            port=8000,
-            settings=Settings(allow_reset=True, anonymized_telemetry=False)
-        )
-        logger.debug(
-            "Attempting to connect to ChromaDB at chroma-container:8000")
-        response = chroma_client.heartbeat()
+        store = get_vector_store()
+        logger.debug(f"Attempting to connect to ChromaDB at {store.host}:{store.port}")
+        response = store.heartbeat()
         logger.debug(f"ChromaDB heartbeat response: {response}")
-        chroma_client.get_or_create_collection(name="health_check_collection")
         health_status["chromadb"] = "connected"
+        health_status["chromadb_circuit"] = store.breaker.state
         logger.info("ChromaDB connection successful")
     except Exception as e:
         logger.error(f"ChromaDB connection failed: {str(e)}", exc_info=True)
@@ -51,7 +41,7 @@ def health_check():
 
 @chroma_bp.route('/embed', methods=['POST'])
 def embed_documents():
-    """Trigger document embedding process."""
+    """Trigger an incremental sync of the document embeddings."""
     try:
         result = process_and_push_data_to_chromadb()
         logger.info(f"Embedding successful: {result}")
@@ -67,10 +57,7 @@ def embed_documents():
 @chroma_bp.route("/document/count", methods=["GET"])
 def document_count():
     try:
-        collection = chroma_client.get_or_create_collection(
-            name=COLLECTION_NAME
-        )
-        count = collection.count()
+        count = get_vector_store().count()
         return jsonify({"document_count": count})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -88,26 +75,76 @@ def document_count():
 
 @chroma_bp.route("/documents", methods=["GET"])
 def get_all_documents():
-    try:
-        # Get collection
-        collection = chroma_client.get_collection(name=COLLECTION_NAME)
+    """List the indexed chunks one page at a time.
 
-        # Retrieve documents (no "ids" in include list!)
-        results = collection.get(include=["documents", "metadatas"], limit=100000)
+    Query parameters:
+      offset, limit  page window (limit defaults to DOCUMENTS_PAGE_SIZE, capped at DOCUMENTS_MAX_PAGE_SIZE)
+      include        comma-separated subset of "documents,metadatas"; ids are always returned
+      format         "ndjson" streams every chunk, one JSON object per line, fetched page by page
+    """
+    try:
+        include = parse_include(request.args.get("include"))
+        offset = max(int(request.args.get("offset", 0)), 0)
+        limit = min(max(int(request.args.get("limit", DOCUMENTS_PAGE_SIZE)), 1), DOCUMENTS_MAX_PAGE_SIZE)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if request.args.get("format") == "ndjson":
+        return Response(
+            stream_with_context(stream_documents(include, offset)),
+            mimetype="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
 
+    try:
+        store = get_vector_store()
+        results = store.get(include=include, limit=limit, offset=offset)
+        documents = list(format_documents(results, include))
         return jsonify({
-            "count": len(results["documents"]),
-            "documents": [
-                {
-                    "id": doc_id,
-                    "content": doc,
-                    "metadata": metadata
-                }
-                for doc_id, doc, metadata in zip(
-                    results["ids"], results["documents"], results["metadatas"]
-                )
-            ]
+            "count": len(documents),
+            "offset": offset,
+            "limit": limit,
+            # Offsets are only stable within one index version; clients should restart if it changes
+            "index_version": current_index_version(),
+            "next_offset": offset + len(documents) if len(documents) == limit else None,
+            "documents": documents
         })
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+
+def parse_include(value):
+    if value is None:
+        return list(DOCUMENT_FIELDS)
+    include = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [field for field in include if field not in DOCUMENT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unsupported include fields: {', '.join(unknown)} (allowed: {', '.join(DOCUMENT_FIELDS)})")
+    return include
+
+
+def format_documents(results, include):
+    """Yield API records for a Chroma get() result, renaming fields to the response keys."""
+    for position, doc_id in enumerate(results["ids"]):
+        record = {"id": doc_id}
+        for field in include:
+            record[DOCUMENT_FIELDS[field]] = results[field][position]
+        yield record
+
+
+def stream_documents(include, offset=0, page_size=DOCUMENTS_STREAM_PAGE_SIZE):
+    """NDJSON lines for every chunk from offset on; only one Chroma page is held in memory."""
+    store = get_vector_store()
+    while True:
+        try:
+            results = store.get(include=include, limit=page_size, offset=offset)
+        except Exception as e:
+            logger.error(f"Document stream failed at offset {offset}: {e}", exc_info=True)
+            yield json.dumps({"error": str(e), "offset": offset}) + "\n"
+            return
+        for record in format_documents(results, include):
+            yield json.dumps(record) + "\n"
+        if len(results["ids"]) < page_size:
+            return
+        offset += page_size
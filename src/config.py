@@ -15,3 +15,145 @@ SENTENCE_TRANSFORMER_MODEL_NAME = "all-MiniLM-L6-v2"
 # For PostgreSQL user storage
 
 JSON_FILE_PATH="/app/Documents/combined_data_with_metadata.json"
+
+# Ingestion batching for chromvec.embedDoc
+EMBED_BATCH_MAX_TOKENS = int(os.getenv('EMBED_BATCH_MAX_TOKENS', 100000))  # Token budget per embedding request
+EMBED_BATCH_MAX_ITEMS = int(os.getenv('EMBED_BATCH_MAX_ITEMS', 256))  # Chunks per embedding request
+EMBED_MAX_CONCURRENCY = int(os.getenv('EMBED_MAX_CONCURRENCY', 4))  # Batches in flight at once
+EMBED_MAX_RETRIES = int(os.getenv('EMBED_MAX_RETRIES', 5))
+EMBED_RETRY_BASE_DELAY = float(os.getenv('EMBED_RETRY_BASE_DELAY', 1.0))  # Seconds, doubled per attempt
+
+# Manifest of indexed documents used for incremental re-indexing
+EMBED_MANIFEST_PATH = os.getenv('EMBED_MANIFEST_PATH', "/app/Documents/embedding_manifest.json")
+
+# Embedding cache shared by ingestion and query embedding
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv('EMBEDDING_CACHE_MEMORY_SIZE', 2048))  # In-process LRU entries
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', "/app/Documents/cache/embeddings.sqlite3")
+EMBEDDING_CACHE_DISK_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_DISK_MAX_ENTRIES', 200000))
+
+# Semantic answer cache in front of ResponseLLM.generate_filtered_response
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() == 'true'
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.92))  # Cosine similarity for a hit
+SEMANTIC_CACHE_TTL_SECONDS = int(os.getenv('SEMANTIC_CACHE_TTL_SECONDS', 3600))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', 1000))
+
+# How answers get their **bold** Markdown:
+#   "inline"    - the generation prompt asks for Markdown directly (no extra call)
+#   "highlight" - a local deterministic highlighter bolds query/context key terms
+#   "llm"       - legacy second gpt-4o-mini round-trip
+DECORATE_MODES = ("inline", "highlight", "llm")
+DECORATE_MODE = os.getenv('DECORATE_MODE', 'inline').lower()
+if DECORATE_MODE not in DECORATE_MODES:
+    # Fail at startup rather than silently paying for the llm round-trip on a typo
+    raise ValueError(f"DECORATE_MODE must be one of {', '.join(DECORATE_MODES)}, got {DECORATE_MODE!r}")
+
+# Gate in front of the query-rewrite LLM call
+REWRITE_SIMILARITY_GATE = os.getenv('REWRITE_SIMILARITY_GATE', 'true').lower() == 'true'
+REWRITE_SHORT_QUERY_WORDS = int(os.getenv('REWRITE_SHORT_QUERY_WORDS', 4))  # Short follow-ups like "what about fees?"
+REWRITE_SIMILARITY_THRESHOLD = float(os.getenv('REWRITE_SIMILARITY_THRESHOLD', 0.35))
+REWRITE_CACHE_SIZE = int(os.getenv('REWRITE_CACHE_SIZE', 1024))
+
+# Async chat pipeline: one event loop per process drives OpenAI/Chroma I/O, CPU work goes to a thread pool
+ASYNC_CPU_WORKERS = int(os.getenv('ASYNC_CPU_WORKERS', 4))  # Reranking / sentence-transformer threads
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 200))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 50))
+PIPELINE_TIMEOUT_SECONDS = float(os.getenv('PIPELINE_TIMEOUT_SECONDS', 120))
+CHROMA_HOST = os.getenv('CHROMA_HOST', "chroma")
+CHROMA_PORT = int(os.getenv('CHROMA_PORT', 8000))
+
+# Process startup
+PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', 'true').lower() == 'true'  # Load CrossEncoder/SentenceTransformer in create_app()
+AUTO_CREATE_SCHEMA = os.getenv('AUTO_CREATE_SCHEMA', 'true').lower() == 'true'  # db.create_all() once in the gunicorn master
+
+# Cross-encoder reranker inference
+RERANKER_BACKEND = os.getenv('RERANKER_BACKEND', 'onnx').lower()  # "onnx" (falls back to torch) or "torch"
+RERANKER_ONNX_DIR = os.getenv('RERANKER_ONNX_DIR', "/app/Documents/cache/reranker-onnx")
+RERANKER_QUANTIZE = os.getenv('RERANKER_QUANTIZE', 'true').lower() == 'true'  # Dynamic int8 weights
+RERANKER_THREADS = int(os.getenv('RERANKER_THREADS', 2))  # Intra-op threads per worker process
+RERANKER_MAX_LENGTH = int(os.getenv('RERANKER_MAX_LENGTH', 512))
+RERANKER_BATCH_WINDOW_MS = float(os.getenv('RERANKER_BATCH_WINDOW_MS', 5))  # 0 disables micro-batching
+RERANKER_MAX_BATCH = int(os.getenv('RERANKER_MAX_BATCH', 64))  # Pairs per forward pass
+RERANK_CACHE_SIZE = int(os.getenv('RERANK_CACHE_SIZE', 50000))  # (query, chunk id) cross-encoder scores; 0 disables
+
+# Hybrid retrieval: BM25 over the same chunks, fused with the vector results by reciprocal rank
+HYBRID_RETRIEVAL = os.getenv('HYBRID_RETRIEVAL', 'true').lower() == 'true'
+BM25_INDEX_PATH = os.getenv('BM25_INDEX_PATH', "/app/Documents/bm25_index.json")
+BM25_K1 = float(os.getenv('BM25_K1', 1.5))
+BM25_B = float(os.getenv('BM25_B', 0.75))
+HYBRID_VECTOR_K = int(os.getenv('HYBRID_VECTOR_K', 10))  # Candidates from the vector query
+HYBRID_LEXICAL_K = int(os.getenv('HYBRID_LEXICAL_K', 10))  # Candidates from BM25
+HYBRID_RRF_K = int(os.getenv('HYBRID_RRF_K', 60))
+HYBRID_RERANK_CANDIDATES = int(os.getenv('HYBRID_RERANK_CANDIDATES', 6))  # Fused candidates sent to the cross-encoder
+
+# Vector lookups: "chroma" (HTTP to the chroma container) or "local" (memory-mapped copy exported by the ingestion job)
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'chroma').lower()
+LOCAL_INDEX_DIR = os.getenv('LOCAL_INDEX_DIR', "/app/Documents/vector_index")
+
+# Shared Chroma access (chromvec/store.py)
+CHROMA_TIMEOUT_SECONDS = float(os.getenv('CHROMA_TIMEOUT_SECONDS', 10))
+CHROMA_CONNECT_TIMEOUT_SECONDS = float(os.getenv('CHROMA_CONNECT_TIMEOUT_SECONDS', 2))
+CHROMA_MAX_CONNECTIONS = int(os.getenv('CHROMA_MAX_CONNECTIONS', 50))  # Keep-alive pool per worker process
+CHROMA_BREAKER_FAILURES = int(os.getenv('CHROMA_BREAKER_FAILURES', 5))  # Consecutive failures before the circuit opens
+CHROMA_BREAKER_RESET_SECONDS = float(os.getenv('CHROMA_BREAKER_RESET_SECONDS', 30))  # Open time before a trial call
+
+# /api/documents export
+DOCUMENTS_PAGE_SIZE = int(os.getenv('DOCUMENTS_PAGE_SIZE', 100))  # Default page for the JSON listing
+DOCUMENTS_MAX_PAGE_SIZE = int(os.getenv('DOCUMENTS_MAX_PAGE_SIZE', 1000))
+DOCUMENTS_STREAM_PAGE_SIZE = int(os.getenv('DOCUMENTS_STREAM_PAGE_SIZE', 200))  # Chroma page size behind the NDJSON stream
+
+# Response logs (JSON Lines, written by a background thread per worker)
+RESPONSE_LOG_MAX_BYTES = int(os.getenv('RESPONSE_LOG_MAX_BYTES', 50 * 1024 * 1024))  # Rotate past this size
+RESPONSE_LOG_ROTATE_SECONDS = int(os.getenv('RESPONSE_LOG_ROTATE_SECONDS', 86400))  # Rotate when the interval rolls over; 0 disables
+RESPONSE_LOG_COMPRESS = os.getenv('RESPONSE_LOG_COMPRESS', 'true').lower() == 'true'  # zstd-compress rotated segments
+RESPONSE_LOG_FLUSH_SECONDS = float(os.getenv('RESPONSE_LOG_FLUSH_SECONDS', 1.0))
+RESPONSE_LOG_BUFFER_SIZE = int(os.getenv('RESPONSE_LOG_BUFFER_SIZE', 10000))  # Queued records per worker before the oldest are dropped
+
+# Conversation history returned by /chat: "turn" (only the new turn), "delta" (turns after the client's cursor) or "full"
+CHAT_HISTORY_MODE = os.getenv('CHAT_HISTORY_MODE', 'turn').lower()
+CHAT_HISTORY_DELTA_LIMIT = int(os.getenv('CHAT_HISTORY_DELTA_LIMIT', 50))  # Newest turns returned in delta mode
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', 50))  # Default page for the history endpoint
+CHAT_HISTORY_MAX_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_MAX_PAGE_SIZE', 500))
+CONVERSATIONS_PAGE_SIZE = int(os.getenv('CONVERSATIONS_PAGE_SIZE', 50))  # Default page for conversation lists
+CONVERSATIONS_MAX_PAGE_SIZE = int(os.getenv('CONVERSATIONS_MAX_PAGE_SIZE', 200))
+
+# Write-behind persistence of chat turns and feedback (ragapp/persistence.py)
+PERSIST_WRITE_BEHIND = os.getenv('PERSIST_WRITE_BEHIND', 'true').lower() == 'true'  # false commits inside the request
+PERSIST_QUEUE_SIZE = int(os.getenv('PERSIST_QUEUE_SIZE', 10000))  # Pending rows per worker before writes spill to disk
+PERSIST_BATCH_SIZE = int(os.getenv('PERSIST_BATCH_SIZE', 200))  # Rows per transaction
+PERSIST_FLUSH_SECONDS = float(os.getenv('PERSIST_FLUSH_SECONDS', 0.2))
+PERSIST_MAX_RETRIES = int(os.getenv('PERSIST_MAX_RETRIES', 3))
+PERSIST_SPILL_PATH = os.getenv('PERSIST_SPILL_PATH', "logs/persistence/spill.jsonl")
+PERSIST_DEAD_LETTER_PATH = os.getenv('PERSIST_DEAD_LETTER_PATH', "logs/persistence/dead_letter.jsonl")  # Rows the DB rejected
+
+# Database engine pool (per worker process; size it for GUNICORN_THREADS plus the ragapp-db and write-behind threads)
+DATABASE_URL = os.getenv('DATABASE_URL', 'postgresql+psycopg2://postgres:postgres@db:5432/buc_users')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))  # Connections kept open
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))  # Extra connections opened under bursts, closed when returned
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))  # Seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # Reconnect connections older than this (seconds)
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'  # Detect connections dropped by the server
+
+# Per-request query counting (querystats.py)
+DB_QUERY_STATS = os.getenv('DB_QUERY_STATS', 'true').lower() == 'true'
+DB_NPLUS1_THRESHOLD = int(os.getenv('DB_NPLUS1_THRESHOLD', 3))  # Same statement this often in one request is flagged
+DB_QUERY_WARN_COUNT = int(os.getenv('DB_QUERY_WARN_COUNT', 10))  # Log requests issuing more queries than this
+
+# Per-worker cache of users' sign-in state (user/signin.py); logins and logouts on another worker
+# reach this one once the entry expires
+SIGNIN_CACHE_TTL_SECONDS = int(os.getenv('SIGNIN_CACHE_TTL_SECONDS', 30))  # 0 disables the cache
+SIGNIN_CACHE_SIZE = int(os.getenv('SIGNIN_CACHE_SIZE', 10000))
+
+# Generation prompt context packing (ragapp/contextpacker.py)
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', 3000))  # Max tokens of retrieved text in the prompt
+CONTEXT_MIN_CHUNK_TOKENS = int(os.getenv('CONTEXT_MIN_CHUNK_TOKENS', 100))  # Smaller leftovers are dropped, not trimmed
+
+# Adaptive retrieval depth (Retriever.aretrieve_and_rerank); cross-encoder scores are logits, > 0 means relevant
+RETRIEVAL_ADAPTIVE = os.getenv('RETRIEVAL_ADAPTIVE', 'true').lower() == 'true'  # false keeps the fixed top 5
+RETRIEVAL_SCORE_THRESHOLD = float(os.getenv('RETRIEVAL_SCORE_THRESHOLD', -5))  # Chunks scoring below are not sent
+RETRIEVAL_MIN_CHUNKS = int(os.getenv('RETRIEVAL_MIN_CHUNKS', 1))  # Kept even when nothing passes the threshold
+RETRIEVAL_MAX_CHUNKS = int(os.getenv('RETRIEVAL_MAX_CHUNKS', 5))
+RETRIEVAL_SEPARATION_MARGIN = float(os.getenv('RETRIEVAL_SEPARATION_MARGIN', 4.0))  # Drop chunks this far below the best
+RETRIEVAL_LOW_SCORE = float(os.getenv('RETRIEVAL_LOW_SCORE', 0.0))  # Best score under this widens the candidate pool
+RETRIEVAL_WIDEN_K = int(os.getenv('RETRIEVAL_WIDEN_K', 20))  # Candidates fetched and reranked when widening
+RETRIEVAL_LATENCY_BUDGET_MS = float(os.getenv('RETRIEVAL_LATENCY_BUDGET_MS', 1500))  # No widening once the first pass took this long
+RETRIEVAL_WIDEN_BUDGET_MS = float(os.getenv('RETRIEVAL_WIDEN_BUDGET_MS', 1000))  # Time allowed for the widening pass
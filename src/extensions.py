@@ -1,9 +1,15 @@
+import os
 from flask_sqlalchemy import SQLAlchemy
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from flask_jwt_extended import JWTManager
+from flask_migrate import Migrate
+from querystats import init_query_stats
 
 
 db = SQLAlchemy()
+jwt = JWTManager()
+migrate = Migrate()
 
 # Limiter setup
 limiter = Limiter(
@@ -16,4 +22,9 @@ limiter = Limiter(
 def init_extensions(app):
     db.init_app(app)
     limiter.init_app(app)
+    jwt.init_app(app)
+    # Per-request query counts/timings and N+1 warnings (DB_QUERY_STATS)
+    init_query_stats(app)
+    # Migrations live in src/migrations regardless of the working directory (gunicorn runs from /app)
+    migrate.init_app(app, db, directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations"))
 
@@ -0,0 +1,44 @@
+import gc
+import os
+import multiprocessing
+
+# Production server settings; override any of them through the environment
+pythonpath = "src"
+wsgi_app = "wsgi:app"
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+worker_class = "gthread"
+workers = int(os.getenv("GUNICORN_WORKERS", min(4, multiprocessing.cpu_count())))
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 0))
+accesslog = "-"
+
+# Import the app (and load model weights) once in the master so forked workers share those pages
+preload_app = True
+
+
+def on_starting(server):
+    """Runs in the master after the app is preloaded and before any worker is forked."""
+    from config import AUTO_CREATE_SCHEMA
+    from extensions import db
+    from app import init_db
+
+    app = server.app.wsgi()
+    if AUTO_CREATE_SCHEMA:
+        init_db(app)
+    # Never hand pooled DB connections to the children
+    with app.app_context():
+        db.engine.dispose()
+
+    # Move everything allocated so far out of the GC's reach so collections in the workers
+    # don't touch (and copy) the shared model pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from ragapp.responseLLM import start_warmup
+
+    start_warmup()
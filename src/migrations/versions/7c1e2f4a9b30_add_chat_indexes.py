@@ -0,0 +1,42 @@
+"""Add indexes for chat history, conversation list, session and feedback lookups
+
+Revision ID: 7c1e2f4a9b30
+Revises:
+Create Date: 2026-10-17 12:00:00
+
+The schema was created with db.create_all(), so this is the first revision. Statements
+use IF NOT EXISTS so databases created after the models declared these indexes upgrade
+cleanly, and Postgres builds them CONCURRENTLY so chat traffic is not blocked.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e2f4a9b30'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ("ix_chat_history_conversation_timestamp", "chat_history", "conversationid, timestamp, historyid"),
+    ("ix_chat_conversations_user_created", "chat_conversations", "useremail, created_at, conversationid"),
+    ("ix_unauthenticated_sessions_session_id", "unauthenticated_sessions", "session_id"),
+    ("ix_chat_feedback_conversation_id", "chat_feedback", "conversation_id"),
+]
+
+
+def upgrade():
+    concurrently = "CONCURRENTLY " if op.get_bind().dialect.name == "postgresql" else ""
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.execute(f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def downgrade():
+    concurrently = "CONCURRENTLY " if op.get_bind().dialect.name == "postgresql" else ""
+    with op.get_context().autocommit_block():
+        for name, _, _ in INDEXES:
+            op.execute(f"DROP INDEX {concurrently}IF EXISTS {name}")
@@ -0,0 +1,118 @@
+import re
+import time
+import logging
+import threading
+from collections import Counter
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import DB_QUERY_STATS, DB_NPLUS1_THRESHOLD, DB_QUERY_WARN_COUNT
+
+logger = logging.getLogger(__name__)
+
+# Collapses IN (...) lists of different lengths so "SELECT ... IN (?, ?)" and "IN (?, ?, ?)" count as one statement
+_IN_LIST = re.compile(r"\(\s*(?:%\([^)]*\)s|\?|:\w+)(?:\s*,\s*(?:%\([^)]*\)s|\?|:\w+))*\s*\)")
+
+
+class RequestQueryStats:
+    """Queries issued on the request thread: count, total time and how often each statement repeated."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[_IN_LIST.sub("(...)", " ".join(statement.split()))] += 1
+
+    def repeated(self, threshold):
+        """Statements run at least threshold times; a typical sign of lazy loading inside a loop (N+1)."""
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+class QueryStats:
+    """Counts and times SQL statements per request and keeps per-endpoint totals.
+
+    Each response carries a Server-Timing "db" entry and X-DB-Queries header. Requests that
+    repeat one statement DB_NPLUS1_THRESHOLD times (e.g. ChatConversation.to_dict() loading
+    chat_history per conversation) or exceed DB_QUERY_WARN_COUNT queries are logged. Queries
+    run outside the request thread (ragapp-db executor, write-behind worker) are not counted.
+    """
+
+    def __init__(self, nplus1_threshold=DB_NPLUS1_THRESHOLD, warn_count=DB_QUERY_WARN_COUNT):
+        self.nplus1_threshold = nplus1_threshold
+        self.warn_count = warn_count
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._listening = False
+
+    def init_app(self, app):
+        if not self._listening:
+            # Listen on the Engine class so every engine Flask-SQLAlchemy creates (per bind, per fork) is covered
+            event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+            self._listening = True
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def _start_request(self):
+        g.query_stats = RequestQueryStats()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start_time = conn.info["query_start_time"].pop()
+        if has_request_context() and "query_stats" in g:
+            g.query_stats.record(statement, time.perf_counter() - start_time)
+
+    def _finish_request(self, response):
+        stats = g.pop("query_stats", None)
+        if stats is None:
+            return response
+        milliseconds = stats.seconds * 1000
+        response.headers["X-DB-Queries"] = str(stats.count)
+        response.headers.add("Server-Timing", f"db;dur={milliseconds:.1f};desc=\"{stats.count} queries\"")
+
+        endpoint = request.endpoint or request.path
+        repeated = stats.repeated(self.nplus1_threshold)
+        for statement, count in repeated:
+            logger.warning(f"Possible N+1 in {endpoint}: statement ran {count} times: {statement[:300]}")
+        if stats.count > self.warn_count:
+            logger.warning(f"{endpoint} issued {stats.count} queries ({milliseconds:.1f} ms)")
+        else:
+            logger.debug(f"{endpoint} issued {stats.count} queries ({milliseconds:.1f} ms)")
+
+        with self._lock:
+            totals = self._endpoints.setdefault(
+                endpoint, {"requests": 0, "queries": 0, "seconds": 0.0, "max_queries": 0, "nplus1_requests": 0}
+            )
+            totals["requests"] += 1
+            totals["queries"] += stats.count
+            totals["seconds"] += stats.seconds
+            totals["max_queries"] = max(totals["max_queries"], stats.count)
+            totals["nplus1_requests"] += bool(repeated)
+        return response
+
+    def report(self):
+        """Per-endpoint query totals for this worker process."""
+        with self._lock:
+            return {
+                endpoint: dict(
+                    totals,
+                    seconds=round(totals["seconds"], 4),
+                    avg_queries=round(totals["queries"] / totals["requests"], 2),
+                    avg_ms=round(totals["seconds"] * 1000 / totals["requests"], 2)
+                )
+                for endpoint, totals in self._endpoints.items()
+            }
+
+
+query_stats = QueryStats()
+
+
+def init_query_stats(app):
+    if DB_QUERY_STATS:
+        query_stats.init_app(app)
@@ -0,0 +1,105 @@
+import time
+import logging
+import threading
+import numpy as np
+from chromvec.manifest import current_index_version
+from config import SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TTL_SECONDS, SEMANTIC_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticAnswerCache:
+    """Bounded cache of generated answers looked up by cosine similarity of the rewritten query.
+
+    Query vectors live in a preallocated matrix so a lookup is a single dot product over
+    the filled slots. Entries expire after ttl seconds, the least recently used slot is
+    reused once the cache is full, and everything is dropped when the index version changes.
+    """
+
+    def __init__(self, model, threshold=SEMANTIC_CACHE_THRESHOLD, ttl=SEMANTIC_CACHE_TTL_SECONDS,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES):
+        self.model = model
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._matrix = np.zeros(
+            (max_entries, model.get_sentence_embedding_dimension()), dtype=np.float32
+        )
+        self._entries = [None] * max_entries
+        self._index_version = current_index_version()
+        self.counters = {"lookups": 0, "hits": 0, "seconds_saved": 0.0}
+
+    def encode(self, query):
+        return self.model.encode(query, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._entries = [None] * self.max_entries
+        self._matrix[:] = 0
+
+    def _check_index_version(self):
+        """Drop every entry once the collection is re-indexed; call with self._lock held."""
+        version = current_index_version()
+        if version != self._index_version:
+            logger.info("Collection re-indexed; clearing semantic answer cache")
+            self._clear()
+            self._index_version = version
+
+    def lookup(self, query):
+        """Return (payload, similarity, vector); payload is None on a miss. The vector can be passed to store()."""
+        vector = self.encode(query)
+        now = time.time()
+
+        with self._lock:
+            self._check_index_version()
+            self.counters["lookups"] += 1
+            scores = self._matrix @ vector
+            for slot in np.argsort(-scores):
+                entry = self._entries[slot]
+                if scores[slot] < self.threshold:
+                    break
+                if entry is None:
+                    continue
+                if now - entry["created_at"] > self.ttl:
+                    self._entries[slot] = None
+                    self._matrix[slot] = 0
+                    continue
+                entry["last_hit"] = now
+                self.counters["hits"] += 1
+                self.counters["seconds_saved"] += entry["pipeline_seconds"]
+                return entry["payload"], float(scores[slot]), vector
+
+        return None, None, vector
+
+    def store(self, vector, payload, pipeline_seconds):
+        now = time.time()
+        with self._lock:
+            self._check_index_version()
+            slot = self._free_slot(now)
+            self._matrix[slot] = vector
+            self._entries[slot] = {
+                "payload": payload,
+                "pipeline_seconds": pipeline_seconds,
+                "created_at": now,
+                "last_hit": now
+            }
+
+    def _free_slot(self, now):
+        oldest_slot, oldest_hit = 0, None
+        for slot, entry in enumerate(self._entries):
+            if entry is None or now - entry["created_at"] > self.ttl:
+                return slot
+            if oldest_hit is None or entry["last_hit"] < oldest_hit:
+                oldest_slot, oldest_hit = slot, entry["last_hit"]
+        return oldest_slot
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        counters["hit_rate"] = round(counters["hits"] / counters["lookups"], 4) if counters["lookups"] else 0.0
+        counters["seconds_saved"] = round(counters["seconds_saved"], 3)
+        return counters
@@ -0,0 +1,87 @@
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from openai import AsyncOpenAI
+from config import (
+    OPENAI_API_KEY, ASYNC_CPU_WORKERS, OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    PIPELINE_TIMEOUT_SECONDS
+)
+
+
+class BackgroundLoop:
+    """One asyncio loop per process, running in a daemon thread.
+
+    Flask views stay synchronous and hand coroutines to this loop, so every in-flight chat
+    shares the same pooled OpenAI/Chroma connections. The loop, its CPU executor and the
+    clients bound to it are recreated after a fork.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self.loop = None
+        self.executor = None
+        self.clients = {}
+
+    def get(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self.loop = asyncio.new_event_loop()
+                self.executor = ThreadPoolExecutor(max_workers=ASYNC_CPU_WORKERS, thread_name_prefix="ragapp-cpu")
+                self.loop.set_default_executor(self.executor)
+                self.clients = {}
+                threading.Thread(target=self.loop.run_forever, name="ragapp-async-loop", daemon=True).start()
+                self._pid = os.getpid()
+            return self
+
+
+_background = BackgroundLoop()
+
+
+def run_async(coro, timeout=PIPELINE_TIMEOUT_SECONDS):
+    """Run a coroutine on the background loop and block the calling thread for its result."""
+    future = asyncio.run_coroutine_threadsafe(coro, _background.get().loop)
+    try:
+        return future.result(timeout)
+    except BaseException:
+        future.cancel()
+        raise
+
+
+def iterate_async(agen, timeout=PIPELINE_TIMEOUT_SECONDS):
+    """Expose an async generator running on the background loop as a plain iterator."""
+    try:
+        while True:
+            try:
+                item = run_async(agen.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        run_async(agen.aclose(), timeout)
+
+
+async def run_in_executor(func, *args, **kwargs):
+    """Offload CPU-bound work (reranking, sentence embeddings) from the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+def get_async_openai():
+    """Pooled AsyncOpenAI client bound to this process's background loop."""
+    clients = _background.get().clients
+    if "openai" not in clients:
+        clients["openai"] = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS
+                ),
+                timeout=httpx.Timeout(PIPELINE_TIMEOUT_SECONDS, connect=10.0)
+            )
+        )
+    return clients["openai"]
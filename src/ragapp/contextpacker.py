@@ -0,0 +1,103 @@
+import logging
+import tiktoken
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_MIN_CHUNK_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# Shortest shared prefix treated as chunk overlap rather than coincidence
+MIN_OVERLAP_CHARS = 32
+
+
+def text_overlap(previous, following):
+    """Length of the longest suffix of previous that is also a prefix of following (0 if shorter than MIN_OVERLAP_CHARS).
+
+    Ingestion splits documents into token windows that share CHUNK_OVERLAP tokens, so
+    neighbouring chunks of the same page repeat each other's edges verbatim.
+    """
+    probe = following[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    start = previous.find(probe)
+    while start != -1:
+        if following.startswith(previous[start:]):
+            return len(previous) - start
+        start = previous.find(probe, start + 1)
+    return 0
+
+
+class ContextPacker:
+    """Fits reranked chunks into a token budget for the generation prompt.
+
+    Chunks are taken best score first. Text already present in a higher-ranked chunk of
+    the same document (full duplicates and overlapping edges) is removed, and only title
+    and text go into the prompt. The last chunk that does not fit is trimmed if at least
+    min_chunk_tokens of it fit; everything after it is dropped.
+    """
+
+    def __init__(self, model="gpt-4o-mini", budget=CONTEXT_TOKEN_BUDGET, min_chunk_tokens=CONTEXT_MIN_CHUNK_TOKENS):
+        try:
+            self.encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self.encoding = tiktoken.get_encoding("o200k_base")
+        self.budget = budget
+        self.min_chunk_tokens = min_chunk_tokens
+
+    def count_tokens(self, text):
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def deduplicate(self, top_n_document):
+        """[(document, text)] in rank order with repeated and overlapping text removed."""
+        kept = []
+        removed = 0
+        for document in top_n_document:
+            text = document["document"].strip()
+            for other, other_text in kept:
+                if other.get("document_link") != document.get("document_link"):
+                    continue
+                if text in other_text:
+                    text = ""
+                    break
+                # This chunk continues a kept one, or precedes it
+                overlap = text_overlap(other_text, text)
+                if overlap:
+                    text = text[overlap:].lstrip()
+                overlap = text_overlap(text, other_text)
+                if overlap:
+                    text = text[:-overlap].rstrip()
+            if text:
+                kept.append((document, text))
+            else:
+                removed += 1
+        return kept, removed
+
+    def pack(self, top_n_document):
+        """Returns (context, report): the prompt context string and token accounting for token details."""
+        chunks, duplicates = self.deduplicate(top_n_document)
+        blocks = []
+        used = 0
+        trimmed = 0
+        for number, (document, text) in enumerate(chunks, start=1):
+            block = f"[{number}] {document.get('document_name', 'Untitled')}\n{text}"
+            tokens = self.encoding.encode(block, disallowed_special=())
+            remaining = self.budget - used
+            if len(tokens) > remaining:
+                if remaining >= self.min_chunk_tokens:
+                    blocks.append(self.encoding.decode(tokens[:remaining]))
+                    used += remaining
+                    trimmed += 1
+                break
+            blocks.append(block)
+            used += len(tokens)
+
+        report = {
+            "Context-Tokens": used,
+            "Context-Budget": self.budget,
+            "Chunks-Retrieved": len(top_n_document),
+            "Chunks-Packed": len(blocks),
+            "Chunks-Deduplicated": duplicates,
+            "Chunks-Trimmed": trimmed,
+            "Chunks-Dropped": len(chunks) - len(blocks),
+        }
+        if report["Chunks-Dropped"]:
+            logger.debug(f"Context budget of {self.budget} tokens dropped {report['Chunks-Dropped']} chunks")
+        return "\n\n".join(blocks), report
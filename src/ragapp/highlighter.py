@@ -0,0 +1,64 @@
+import re
+
+STOPWORDS = {
+    "the", "and", "for", "are", "but", "not", "you", "your", "can", "how", "what", "when", "where",
+    "who", "why", "which", "does", "did", "was", "were", "has", "have", "had", "with", "from", "into",
+    "about", "this", "that", "these", "those", "there", "their", "them", "they", "then", "than",
+    "any", "all", "our", "out", "get", "tell", "please", "need", "want", "know", "etsu", "is", "do",
+}
+
+# Spans that must not be touched: existing bold, inline code, Markdown links and bare URLs
+PROTECTED_PATTERN = re.compile(r"(\*\*.+?\*\*|`[^`]+`|\[[^\]]*\]\([^)]*\)|https?://\S+)")
+
+# Grounded facts worth bolding when they appear both in the context and in the answer
+IDENTIFIER_PATTERNS = [
+    re.compile(r"\(?\b\d{3}\)?[-.\s]\d{3}[-.]\d{4}\b"),  # Phone numbers
+    re.compile(r"\b[\w.+-]+@[\w-]+\.[\w.]+\b"),  # Email addresses
+    re.compile(r"\b[A-Z]{2,5}[ -]?\d{3,4}\b"),  # Course codes, room numbers
+    re.compile(r"\b\d{1,2}(?::\d{2})?\s?(?:a\.m\.|p\.m\.|am|pm|AM|PM)"),  # Times
+    re.compile(r"\b[A-Z][\w&'-]+(?:\s+(?:of|and|for|the)?\s*[A-Z][\w&'-]+)+"),  # Capitalised names
+]
+
+
+def key_terms(answer, query, context_data, max_terms=12):
+    """Pick terms to bold: identifiers and names grounded in the context first, then query keywords."""
+    context_text = " ".join(text for document in context_data for text in document.values())
+    answer_lower = answer.lower()
+    terms = []
+
+    for pattern in IDENTIFIER_PATTERNS:
+        for match in pattern.findall(context_text):
+            term = match.strip()
+            if term and term in answer and term not in terms:
+                terms.append(term)
+
+    for word in re.findall(r"[A-Za-z][\w-]{2,}", query):
+        if word.lower() not in STOPWORDS and word.lower() in answer_lower and word not in terms:
+            terms.append(word)
+
+    return terms[:max_terms]
+
+
+def highlight_terms(answer, query, context_data, max_terms=12):
+    """Bold the first occurrence of each key term in the answer without another LLM call."""
+    terms = key_terms(answer, query, context_data, max_terms)
+    if not terms:
+        return answer
+
+    # Longest first so "Sherrod Library" wins over "Library"
+    term_pattern = re.compile(
+        r"(?<![\w*])(" + "|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)) + r")(?![\w*])",
+        re.IGNORECASE
+    )
+    seen = set()
+
+    def bold(match):
+        key = match.group(1).lower()
+        if key in seen:
+            return match.group(0)
+        seen.add(key)
+        return f"**{match.group(1)}**"
+
+    parts = PROTECTED_PATTERN.split(answer)
+    # split() with a capturing group alternates plain text (even) and protected spans (odd)
+    return "".join(part if i % 2 else term_pattern.sub(bold, part) for i, part in enumerate(parts))
@@ -4,6 +4,10 @@ from datetime import datetime
 
 class ChatHistory(db.Model):
     __tablename__ = "chat_history"
+    __table_args__ = (
+        # History reads filter by conversation and page in (timestamp, historyid) order
+        db.Index("ix_chat_history_conversation_timestamp", "conversationid", "timestamp", "historyid"),
+    )
 
     historyid = db.Column(db.Integer, primary_key=True, autoincrement=True)
     conversationid = db.Column(db.Integer, db.ForeignKey(
@@ -31,6 +35,10 @@ class ChatHistory(db.Model):
 
 class ChatConversation(db.Model):
     __tablename__ = "chat_conversations"
+    __table_args__ = (
+        # Conversation lists filter by owner, newest first
+        db.Index("ix_chat_conversations_user_created", "useremail", "created_at", "conversationid"),
+    )
 
     conversationid = db.Column(db.Integer, primary_key=True, autoincrement=True)
     useremail = db.Column(db.String(120), db.ForeignKey('users.email'), nullable=True)
@@ -55,7 +63,7 @@ class UnauthenticatedSession(db.Model):
     __tablename__ = "unauthenticated_sessions"
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)  # Unique identifier for each row
-    session_id = db.Column(db.String(255), nullable=False)  # Unique session ID
+    session_id = db.Column(db.String(255), nullable=False, index=True)  # Unique session ID
     conversation_id = db.Column(db.Integer, nullable=False)  # Conversation ID
     userquery = db.Column(db.Text, nullable=False)  # User query
     llmresponse = db.Column(db.Text, nullable=False)  # LLM response
@@ -81,7 +89,7 @@ class ChatFeedback(db.Model):
     __tablename__ = 'chat_feedback'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    conversation_id = db.Column(db.Integer, nullable=True)
+    conversation_id = db.Column(db.Integer, nullable=True, index=True)
     message_index = db.Column(db.Integer, nullable=True)
     vote = db.Column(db.String(10), nullable=False)
     comment = db.Column(db.Text, nullable=True)
@@ -0,0 +1,90 @@
+import json
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_
+from extensions import db
+from config import CONVERSATIONS_PAGE_SIZE
+from .models import ChatConversation
+
+
+def encode_cursor(*values):
+    """Opaque, URL-safe cursor for keyset pagination; datetimes are stored as ISO strings."""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(payload, list):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return payload
+
+
+def encode_keyset_cursor(timestamp, row_id=None):
+    """Cursor for a (timestamp, id) keyset such as (created_at, conversationid) or (timestamp, historyid)."""
+    return encode_cursor(timestamp, row_id)
+
+
+def decode_keyset_cursor(cursor):
+    """Return (timestamp, row_id); row_id is None for cursors handed out before the row had an id."""
+    payload = decode_cursor(cursor)
+    try:
+        timestamp = datetime.fromisoformat(payload[0])
+        row_id = int(payload[1]) if len(payload) > 1 and payload[1] is not None else None
+    except (IndexError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    return timestamp, row_id
+
+
+def parse_limit(value, default, maximum):
+    """Clamp a ?limit= value to [1, maximum]; raises ValueError if it is not an integer."""
+    if value in (None, ""):
+        return default
+    return min(max(int(value), 1), maximum)
+
+
+def keyset_condition(columns, values, descending=False):
+    """WHERE clause selecting rows strictly after values in ORDER BY columns; trailing None values are ignored."""
+    column, value = columns[0], values[0]
+    after = column < value if descending else column > value
+    if len(columns) == 1 or values[1] is None:
+        return after
+    return or_(after, and_(column == value, keyset_condition(columns[1:], values[1:], descending)))
+
+
+def keyset_page(query, columns, after=None, limit=None, descending=False):
+    """Order query by columns, resume after the given key values and fetch one extra row.
+
+    Returns (rows, has_more).
+    """
+    if after is not None:
+        query = query.filter(keyset_condition(columns, after, descending))
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+    if limit:
+        query = query.limit(limit + 1)
+    rows = query.all()
+    has_more = bool(limit) and len(rows) > limit
+    return (rows[:limit] if limit else rows), has_more
+
+
+def next_page_cursor(rows, has_more, timestamp_field, id_field):
+    """Cursor for the page after rows, or None on the last page."""
+    if not has_more:
+        return None
+    return encode_keyset_cursor(getattr(rows[-1], timestamp_field), getattr(rows[-1], id_field))
+
+
+def conversation_rows(useremail, after=None, limit=CONVERSATIONS_PAGE_SIZE):
+    """One page of a user's conversations, newest first, keyset-paginated on (created_at, conversationid)."""
+    query = db.session.query(
+        ChatConversation.conversationid, ChatConversation.title, ChatConversation.created_at
+    ).filter(ChatConversation.useremail == useremail)
+    return keyset_page(
+        query, [ChatConversation.created_at, ChatConversation.conversationid], after=after, limit=limit,
+        descending=True
+    )
@@ -0,0 +1,346 @@
+import os
+import glob
+import json
+import uuid
+import time
+import queue
+import fcntl
+import atexit
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError, InterfaceError, TimeoutError as PoolTimeoutError
+from extensions import db
+from .models import ChatHistory, ChatConversation, ChatFeedback
+from config import (
+    PERSIST_WRITE_BEHIND, PERSIST_QUEUE_SIZE, PERSIST_BATCH_SIZE, PERSIST_FLUSH_SECONDS, PERSIST_MAX_RETRIES,
+    PERSIST_SPILL_PATH, PERSIST_DEAD_LETTER_PATH
+)
+
+logger = logging.getLogger(__name__)
+
+# Row kinds accepted by WriteBehindQueue.add() and the table each one is inserted into
+TABLES = {"chat_history": ChatHistory.__table__, "feedback": ChatFeedback.__table__}
+DATETIME_FIELDS = ("timestamp",)
+
+
+class WriteBehindQueue:
+    """Persists chat turns and feedback from a background thread instead of the request.
+
+    Rows are queued per worker process and inserted in multi-row transactions of up to
+    batch_size; each batch also bumps last_updated on the conversations it touched. If the
+    database rejects a batch, it is retried row by row and only the rows that still fail
+    go to a dead-letter file. A batch that still cannot reach the database after
+    max_retries, and any row that arrives while the queue is full, is appended to a JSONL
+    spill file, which is replayed once the database accepts writes again. Replay is
+    at-least-once: a claimed spill file is only deleted after all of its rows are written
+    or spilled again, and files left behind by a crashed replay are picked up at startup.
+    With enabled=False rows are written synchronously by the caller.
+    """
+
+    def __init__(self, enabled=PERSIST_WRITE_BEHIND, queue_size=PERSIST_QUEUE_SIZE, batch_size=PERSIST_BATCH_SIZE,
+                 flush_seconds=PERSIST_FLUSH_SECONDS, max_retries=PERSIST_MAX_RETRIES, spill_path=PERSIST_SPILL_PATH,
+                 dead_letter_path=PERSIST_DEAD_LETTER_PATH):
+        self.enabled = enabled
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_retries = max_retries
+        self.spill_path = spill_path
+        self.dead_letter_path = dead_letter_path
+        self.app = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._pid = None
+        self.counters = {
+            "queued": 0, "written": 0, "batches": 0, "failed_batches": 0, "spilled": 0, "replayed": 0,
+            "dead_lettered": 0,
+            "max_depth": 0, "last_batch_seconds": 0.0
+        }
+
+    def init_app(self, app):
+        self.app = app
+        atexit.register(self.drain)
+
+    def add(self, kind, values):
+        """Persist one row of kind ("chat_history" or "feedback"); returns immediately in write-behind mode."""
+        item = {"kind": kind, "values": values}
+        if not self.enabled:
+            self._write_batch([item])
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Backpressure: keep the request fast and the row durable
+            logger.warning("Write-behind queue full; spilling row to disk")
+            self._spill([item])
+            return
+        with self._lock:
+            self.counters["queued"] += 1
+            self.counters["max_depth"] = max(self.counters["max_depth"], self._queue.qsize())
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Rows queued before a fork belong to the parent
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                threading.Thread(target=self._run, name="write-behind", daemon=True).start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        # This is the process's only writer thread, so no step may let an exception end it
+        for path in glob.glob(f"{glob.escape(self.spill_path)}.*.replay"):
+            self._safely(self._replay_file, path, claim=False)
+        self._safely(self._replay_spill)
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                written = self._write_with_retries(batch)
+            except Exception as e:
+                # Rows written before the error may be written again on replay; spilling the
+                # whole batch favours a duplicate over a lost row
+                logger.error(f"Write-behind worker failed on a batch of {len(batch)} rows: {e}", exc_info=True)
+                self._safely(self._spill, batch)
+                continue
+            if written:
+                self._safely(self._replay_spill)
+
+    def _safely(self, func, *args, **kwargs):
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Write-behind {func.__name__} failed: {e}", exc_info=True)
+
+    def _write_with_retries(self, batch):
+        for attempt in range(1, self.max_retries + 1):
+            batch = self._write_or_isolate(batch)
+            if not batch:
+                return True
+            logger.warning(f"Write-behind batch of {len(batch)} rows could not reach the database "
+                           f"(attempt {attempt}/{self.max_retries})")
+            time.sleep(min(0.5 * (2 ** (attempt - 1)), 5))
+        self._spill(batch)
+        return False
+
+    def _write_or_isolate(self, batch):
+        """Write batch; returns the rows left unwritten because the database is unreachable.
+
+        A rejected multi-row insert is retried row by row so one bad row cannot hold back
+        the others; rows the database rejects on their own are dead-lettered.
+        """
+        try:
+            self._write_batch(batch)
+            return []
+        except Exception as e:
+            with self._lock:
+                self.counters["failed_batches"] += 1
+            if is_transient(e):
+                logger.warning(f"Write-behind batch failed: {e}")
+                return batch
+            if len(batch) == 1:
+                self._dead_letter(batch[0], e)
+                return []
+            logger.warning(f"Write-behind batch of {len(batch)} rows rejected, retrying row by row: {e}")
+
+        pending = []
+        for item in batch:
+            try:
+                self._write_batch([item])
+            except Exception as e:
+                if is_transient(e):
+                    pending.append(item)
+                else:
+                    self._dead_letter(item, e)
+        return pending
+
+    def _dead_letter(self, item, error):
+        self._dead_letter_record(encode_item(item), error)
+
+    def _dead_letter_record(self, record, error):
+        record = dict(record, error=str(error))
+        try:
+            self._append_locked(self.dead_letter_path, [record])
+        except OSError as e:
+            logger.error(f"Could not write to {self.dead_letter_path} ({e}); dropping row {record}")
+        with self._lock:
+            self.counters["dead_lettered"] += 1
+        logger.error(f"Dead-lettered a {record.get('kind', 'spilled')} row to {self.dead_letter_path}: {error}")
+
+    def _write_batch(self, batch):
+        start_time = time.perf_counter()
+        with self.app.app_context():
+            try:
+                rows_by_kind = {}
+                touched = {}
+                for item in batch:
+                    rows_by_kind.setdefault(item["kind"], []).append(item["values"])
+                    if item["kind"] == "chat_history":
+                        conversation_id = item["values"]["conversationid"]
+                        touched[conversation_id] = max(touched.get(conversation_id, item["values"]["timestamp"]),
+                                                       item["values"]["timestamp"])
+                for kind, rows in rows_by_kind.items():
+                    # executemany; SQLAlchemy batches these into multi-row INSERTs
+                    db.session.execute(TABLES[kind].insert(), rows)
+                for conversation_id, last_updated in touched.items():
+                    db.session.execute(
+                        update(ChatConversation.__table__)
+                        .where(ChatConversation.__table__.c.conversationid == conversation_id)
+                        .values(last_updated=last_updated)
+                    )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+        with self._lock:
+            self.counters["written"] += len(batch)
+            self.counters["batches"] += 1
+            self.counters["last_batch_seconds"] = round(time.perf_counter() - start_time, 4)
+
+    def _spill(self, batch):
+        self._append_locked(self.spill_path, [encode_item(item) for item in batch])
+        with self._lock:
+            self.counters["spilled"] += len(batch)
+        logger.error(f"Spilled {len(batch)} rows to {self.spill_path}")
+
+    def _append_locked(self, path, records):
+        dir_path = os.path.dirname(path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        lines = "".join(json.dumps(record, default=str) + "\n" for record in records)
+        file = open_locked(path)
+        try:
+            file.write(lines)
+            file.flush()
+            os.fsync(file.fileno())
+        finally:
+            file.close()  # Releases the flock
+
+    def _replay_spill(self):
+        if os.path.exists(self.spill_path):
+            self._replay_file(self.spill_path, claim=True)
+
+    def _replay_file(self, path, claim):
+        """Write a spill file back in batches, deleting it only once every row is written or re-spilled.
+
+        With claim=True the spill file is first renamed to a .replay file. The rename happens
+        under the same flock _spill appends with, and _spill re-checks the inode after locking,
+        so no row can be appended to a file that is already claimed. The flock is held until
+        the .replay file is deleted, so a worker recovering leftovers (claim=False) skips files
+        that are still being replayed.
+        """
+        try:
+            file = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return
+        try:
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX if claim else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # Another worker is replaying it
+            try:
+                if os.stat(path).st_ino != os.fstat(file.fileno()).st_ino:
+                    return  # Claimed or finished by another worker meanwhile
+            except FileNotFoundError:
+                return
+            if claim:
+                claimed = f"{self.spill_path}.{os.getpid()}-{uuid.uuid4().hex[:8]}.replay"
+                os.replace(path, claimed)
+                path = claimed
+
+            items = []
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    items.append(decode_item(json.loads(line)))
+                except (ValueError, KeyError, TypeError) as e:
+                    # e.g. a line truncated by a crash mid-append; it must not block the rows after it
+                    self._dead_letter_record({"spill_line": line.rstrip("\n")}, e)
+            self._replay_items(items)
+            os.remove(path)
+        finally:
+            file.close()
+
+    def _replay_items(self, items):
+        logger.info(f"Replaying {len(items)} spilled rows")
+        for i in range(0, len(items), self.batch_size):
+            batch = items[i:i + self.batch_size]
+            pending = self._write_or_isolate(batch)
+            with self._lock:
+                self.counters["replayed"] += len(batch) - len(pending)
+            if pending:
+                logger.error("Replay could not reach the database, keeping rows spilled")
+                self._spill(pending + items[i + self.batch_size:])
+                return
+
+    def drain(self):
+        """Write whatever is still queued (called at interpreter exit)."""
+        if self._pid != os.getpid():
+            return
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            pending = self._write_or_isolate(batch)
+            if pending:
+                logger.error("Failed to drain write-behind queue")
+                self._spill(pending)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        counters["enabled"] = self.enabled
+        counters["depth"] = self._queue.qsize() if self._pid == os.getpid() else 0
+        counters["capacity"] = self.queue_size
+        return counters
+
+
+def is_transient(error):
+    """Errors that say the database is unreachable or overloaded, rather than that it rejected the rows."""
+    return isinstance(error, (OperationalError, InterfaceError, PoolTimeoutError)) or \
+        getattr(error, "connection_invalidated", False)
+
+
+def open_locked(path):
+    """Open path for appending under an exclusive flock, retrying if the file was renamed meanwhile."""
+    while True:
+        file = open(path, "a", encoding="utf-8")
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            if os.stat(path).st_ino == os.fstat(file.fileno()).st_ino:
+                return file
+        except FileNotFoundError:
+            pass
+        file.close()
+
+
+def encode_item(item):
+    values = {key: value.isoformat() if isinstance(value, datetime) else value for key, value in item["values"].items()}
+    return {"kind": item["kind"], "values": values}
+
+
+def decode_item(item):
+    values = dict(item["values"])
+    for field in DATETIME_FIELDS:
+        if isinstance(values.get(field), str):
+            values[field] = datetime.fromisoformat(values[field])
+    return {"kind": item["kind"], "values": values}
+
+
+write_behind = WriteBehindQueue()
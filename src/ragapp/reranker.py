@@ -0,0 +1,265 @@
+import os
+import time
+import fcntl
+import inspect
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+import numpy as np
+from config import (
+    RERANKER_MODEL, RERANKER_BACKEND, RERANKER_ONNX_DIR, RERANKER_QUANTIZE, RERANKER_THREADS,
+    RERANKER_MAX_LENGTH, RERANKER_BATCH_WINDOW_MS, RERANKER_MAX_BATCH
+)
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the export changes, so models exported by an older version are not reused
+EXPORT_VERSION = 2
+
+
+class TorchReranker:
+    """sentence_transformers CrossEncoder on PyTorch (the original backend)."""
+
+    name = "torch"
+
+    def __init__(self, model_name=RERANKER_MODEL, threads=RERANKER_THREADS):
+        import torch
+        from sentence_transformers import CrossEncoder
+
+        if threads > 0:
+            torch.set_num_threads(threads)
+        self.model = CrossEncoder(model_name)
+
+    def predict(self, pairs):
+        return [float(score) for score in self.model.predict(pairs)]
+
+
+class OnnxReranker:
+    """The same cross-encoder exported to ONNX (optionally int8-quantized) and run with onnxruntime.
+
+    The model is exported once into onnx_dir, guarded by a file lock so concurrent workers
+    don't race. The inference session is created lazily per process because onnxruntime
+    thread pools do not survive a fork; a process that cannot open it falls back to the
+    PyTorch model.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_name=RERANKER_MODEL, onnx_dir=RERANKER_ONNX_DIR, quantize=RERANKER_QUANTIZE,
+                 threads=RERANKER_THREADS, max_length=RERANKER_MAX_LENGTH):
+        from transformers import AutoConfig, AutoTokenizer
+
+        self.model_name = model_name
+        self.onnx_dir = onnx_dir
+        self.quantize = quantize
+        self.threads = threads
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+        # Match CrossEncoder.predict: the model config may pin the activation, otherwise
+        # single-label models get a sigmoid
+        config = AutoConfig.from_pretrained(model_name)
+        activation = getattr(config, "sbert_ce_default_activation_function", None)
+        self.apply_sigmoid = "Sigmoid" in activation if activation else config.num_labels == 1
+
+        self.fp32_path = os.path.join(onnx_dir, f"model-v{EXPORT_VERSION}.onnx")
+        self.model_path = os.path.join(onnx_dir, f"model-v{EXPORT_VERSION}.int8.onnx") if quantize else self.fp32_path
+        self._session = None
+        self._pid = None
+        self._fallback = None
+        self._lock = threading.Lock()
+
+    def ensure_exported(self):
+        if os.path.exists(self.model_path):
+            return
+        os.makedirs(self.onnx_dir, exist_ok=True)
+        with open(os.path.join(self.onnx_dir, ".export.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if not os.path.exists(self.model_path):
+                    self._export()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _export(self):
+        import torch
+        from transformers import AutoModelForSequenceClassification
+
+        start_time = time.time()
+        fp32_path = self.fp32_path
+        model = AutoModelForSequenceClassification.from_pretrained(self.model_name).eval()
+        if not os.path.exists(fp32_path):
+            sample = self.tokenizer(["query"], ["document"], return_tensors="pt")
+            # Graph inputs follow forward()'s parameter order (input_ids, attention_mask, token_type_ids
+            # for BERT), not the tokenizer's key order, so name them in that order and pass them by keyword
+            parameters = inspect.signature(model.forward).parameters
+            input_names = [name for name in parameters if name in sample]
+            dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+            dynamic_axes["logits"] = {0: "batch"}
+            tmp_path = f"{fp32_path}.tmp"
+            with torch.no_grad():
+                torch.onnx.export(
+                    model, (), tmp_path, kwargs={name: sample[name] for name in input_names},
+                    input_names=input_names, output_names=["logits"],
+                    dynamic_axes=dynamic_axes, opset_version=14
+                )
+            self._verify(model, tmp_path, atol=1e-3)
+            os.replace(tmp_path, fp32_path)
+
+        if self.quantize:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+
+            tmp_path = f"{self.model_path}.tmp"
+            quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+            # int8 shifts the logits slightly; the ranking of clearly different pairs must not change
+            self._verify(model, tmp_path, atol=1.0)
+            os.replace(tmp_path, self.model_path)
+        logger.info(f"Exported {self.model_name} to {self.model_path} in {time.time() - start_time:.1f}s")
+
+    def _verify(self, model, onnx_path, atol):
+        """Compare the exported graph's logits with the PyTorch model; raises if they disagree."""
+        import torch
+        import onnxruntime as ort
+
+        pairs = [
+            ("where is the library", "The Sherrod Library is located in the center of campus."),
+            ("where is the library", "Tuition and fees are due before the first day of classes."),
+            ("how do I reset my password", "Reset your password through the IT help desk portal."),
+        ]
+        features = self.tokenizer(
+            [query for query, _ in pairs], [document for _, document in pairs],
+            padding=True, truncation=True, max_length=self.max_length, return_tensors="pt"
+        )
+        with torch.no_grad():
+            expected = model(**features).logits[:, 0].numpy()
+        session = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+        input_names = {node.name for node in session.get_inputs()}
+        actual = session.run(["logits"], {
+            name: value.numpy().astype(np.int64) for name, value in features.items() if name in input_names
+        })[0][:, 0]
+        # The first two pairs share a query: the relevant passage must still win
+        if not np.allclose(actual, expected, atol=atol) or (actual[0] > actual[1]) != (expected[0] > expected[1]):
+            raise RuntimeError(f"ONNX export of {self.model_name} does not match PyTorch: {actual} vs {expected}")
+
+    def session(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                import onnxruntime as ort
+
+                self.ensure_exported()
+                options = ort.SessionOptions()
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                options.intra_op_num_threads = self.threads
+                options.inter_op_num_threads = 1
+                self._session = ort.InferenceSession(
+                    self.model_path, sess_options=options, providers=["CPUExecutionProvider"]
+                )
+                self._input_names = {node.name for node in self._session.get_inputs()}
+                self._pid = os.getpid()
+            return self._session
+
+    def predict(self, pairs):
+        if not pairs:
+            return []
+        if self._fallback is not None:
+            return self._fallback.predict(pairs)
+        try:
+            session = self.session()
+        except Exception as e:
+            with self._lock:
+                if self._fallback is None:
+                    logger.warning(f"ONNX session unavailable in process {os.getpid()}, falling back to PyTorch: {e}")
+                    self._fallback = TorchReranker(self.model_name, self.threads)
+            return self._fallback.predict(pairs)
+        features = self.tokenizer(
+            [query for query, _ in pairs], [document for _, document in pairs],
+            padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+        )
+        inputs = {name: value.astype(np.int64) for name, value in features.items() if name in self._input_names}
+        logits = session.run(["logits"], inputs)[0][:, 0]
+        if self.apply_sigmoid:
+            logits = 1 / (1 + np.exp(-logits))
+        return [float(score) for score in logits]
+
+
+class MicroBatcher:
+    """Coalesces predict() calls from concurrent requests into one forward pass.
+
+    The first waiting request opens a window of window_ms; every request that arrives
+    before it closes (up to max_batch pairs) is scored in the same batch.
+    """
+
+    def __init__(self, backend, window_ms=RERANKER_BATCH_WINDOW_MS, max_batch=RERANKER_MAX_BATCH):
+        self.backend = backend
+        self.name = backend.name
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+        self.counters = {"requests": 0, "batches": 0, "pairs": 0}
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, name="reranker-batcher", daemon=True).start()
+                self._pid = os.getpid()
+
+    def predict(self, pairs):
+        if not pairs:
+            return []
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((list(pairs), future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = time.perf_counter() + self.window
+            while size < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            all_pairs = [pair for pairs, _ in batch for pair in pairs]
+            try:
+                scores = self.backend.predict(all_pairs)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for pairs, future in batch:
+                future.set_result(scores[offset:offset + len(pairs)])
+                offset += len(pairs)
+            self.counters["requests"] += len(batch)
+            self.counters["batches"] += 1
+            self.counters["pairs"] += len(all_pairs)
+
+
+def load_reranker(backend=RERANKER_BACKEND, window_ms=RERANKER_BATCH_WINDOW_MS):
+    """Build the configured reranker backend, wrapped in a MicroBatcher unless window_ms is 0."""
+    reranker = None
+    if backend == "onnx":
+        try:
+            reranker = OnnxReranker()
+            # Export now, so a failed export falls back here. The session is opened on the first
+            # predict in each worker: under preload_app this runs in the gunicorn master
+            reranker.ensure_exported()
+        except Exception as e:
+            reranker = None
+            logger.warning(f"ONNX reranker unavailable, falling back to PyTorch: {e}")
+    if reranker is None:
+        reranker = TorchReranker()
+    return MicroBatcher(reranker, window_ms=window_ms) if window_ms > 0 else reranker
@@ -1,20 +1,39 @@
 import os
+import re
+import asyncio
 import time
 import logging
-from openai import OpenAI
+import threading
+from cachetools import LRUCache
 from ragapp.retriever import Retriever
+from ragapp.answercache import SemanticAnswerCache
+from ragapp.highlighter import highlight_terms
+from ragapp.contextpacker import ContextPacker
+from ragapp.stagetimer import StageTimer
+from ragapp.asyncsupport import get_async_openai, run_async, iterate_async, run_in_executor
 from langchain.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain_core.messages import HumanMessage, AIMessage
-from config import OPENAI_API_KEY, SENTENCE_TRANSFORMER_MODEL_NAME
+from config import (
+    SENTENCE_TRANSFORMER_MODEL_NAME, SEMANTIC_CACHE_ENABLED, DECORATE_MODE,
+    REWRITE_SIMILARITY_GATE, REWRITE_SHORT_QUERY_WORDS, REWRITE_SIMILARITY_THRESHOLD, REWRITE_CACHE_SIZE,
+    RETRIEVAL_SCORE_THRESHOLD
+)
 from sentence_transformers import SentenceTransformer, util
  
+# Words and openers that only make sense with respect to an earlier message
+ANAPHORA_PATTERN = re.compile(
+    r"\b(he|she|him|his|her|hers|it|its|they|them|their|theirs|this|that|these|those|"
+    r"such|same|former|latter|above|previous|earlier|aforementioned|else|another|"
+    r"instead|too|either|neither)\b"
+    r"|^\s*(and|also|but|or|so|what about|how about|what else|then)\b",
+    re.IGNORECASE
+)
+ 
 class ResponseLLM:
     def __init__(self):
-        # Initialize API clients
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
- 
+        # OpenAI calls go through the pooled async client from ragapp.asyncsupport
         # Define LLM
         self.llm = ChatOpenAI(model='gpt-4o-mini', temperature=0.5)
  
@@ -38,45 +57,216 @@ class ResponseLLM:
         Respond only with the decorated Markdown-formatted text.
         """
  
+        # In inline mode the generation prompt produces the Markdown itself, so no decorate call is needed
+        self.decorate_mode = DECORATE_MODE
+        self.markdown_instruction = (
+            "- Format the answer in Markdown and use **bold** to highlight important terms such as names, "
+            "places, dates, times, phone numbers and course codes."
+            if self.decorate_mode == "inline" else ""
+        )
+ 
         # Initialize retriever
         self.retriever = Retriever()
+
+        # Token-budgeted prompt context, counted with the generation model's tokenizer
+        self.context_packer = ContextPacker(model="gpt-4o-mini")
+ 
+        # Memoized rewrites keyed by (history, query)
+        self.rewrite_cache = LRUCache(maxsize=REWRITE_CACHE_SIZE)
+        self.rewrite_cache_lock = threading.Lock()
+ 
+        # Semantic cache of previous answers, keyed by the rewritten query
+        self.answer_cache = SemanticAnswerCache(self.similarity_model) if SEMANTIC_CACHE_ENABLED else None
  
     def count_tokens(self, context_data):
-        """Counts total tokens in the retrieved context data."""
-        return sum(len(text.split()) for document in context_data for text in document.values())
+        """Counts total tokens in the retrieved context data (tiktoken, generation model encoding)."""
+        return sum(self.context_packer.count_tokens(text) for document in context_data for text in document.values())
  
-    def rewrite_query(self, query, history_userquery):
+    async def arewrite_query(self, query, history_userquery):
         """Rewrites the user query using the provided conversation history."""
         history = str({index: item for index, item in enumerate(history_userquery)} if history_userquery else "")
  
-        # FIX: replaced deprecated llm.predict() with llm.invoke().content
-        rewritten_query = self.llm.invoke(
+        rewritten_query = (await self.llm.ainvoke(
             self.rewrite_prompt.format_messages(question=query, history=history)
-        ).content
+        )).content
  
         return rewritten_query
  
-    def decorate_text(self, raw_response):
-        """Decorates the raw LLM response with Markdown formatting."""
-        # FIX: replaced deprecated llm.predict() with llm.invoke().content
-        decorated_text = self.llm.invoke(
+    def needs_rewrite(self, query, history_userquery):
+        """Cheap local check for whether the query depends on the conversation history."""
+        if not history_userquery:
+            return False
+        if ANAPHORA_PATTERN.search(query):
+            return True
+        if not REWRITE_SIMILARITY_GATE or len(query.split()) > REWRITE_SHORT_QUERY_WORDS:
+            return False
+ 
+        # Short elliptical follow-ups ("fees?", "deadline for spring") that stay on the previous topic
+        embeddings = self.similarity_model.encode([query] + list(history_userquery), convert_to_tensor=True)
+        similarity = util.cos_sim(embeddings[0:1], embeddings[1:]).max().item()
+        return similarity >= REWRITE_SIMILARITY_THRESHOLD
+ 
+    async def aresolve_query(self, query, history_userquery):
+        """Returns (query_to_use, source) where source is "skipped", "cached" or "llm"."""
+        if not history_userquery:
+            return query, "skipped"
+        if not await run_in_executor(self.needs_rewrite, query, history_userquery):
+            return query, "skipped"
+ 
+        key = (tuple(history_userquery), query)
+        with self.rewrite_cache_lock:
+            cached = self.rewrite_cache.get(key)
+        if cached is not None:
+            return cached, "cached"
+ 
+        rewritten_query = await self.arewrite_query(query, history_userquery)
+        with self.rewrite_cache_lock:
+            self.rewrite_cache[key] = rewritten_query
+        return rewritten_query, "llm"
+ 
+    async def adecorate_text(self, raw_response, query="", context_data=None):
+        """Decorates the raw LLM response with Markdown formatting according to DECORATE_MODE."""
+        if self.decorate_mode == "inline":
+            return raw_response
+        if self.decorate_mode == "highlight":
+            return highlight_terms(raw_response, query, context_data or [])
+ 
+        decorated_text = (await self.llm.ainvoke(
             self.decorate_text_prompt.format(raw_response=raw_response)
-        ).content
+        )).content
+        return decorated_text
+ 
+    def build_generation_prompt(self, rewritten_query, prompt_context):
+        """Builds the grounded answer prompt sent to GPT from the packed context (see ContextPacker)."""
+        return f"""
+                
+                        Your identity is: "BucAIDE - conversational and context-aware QnA platform for East Tennessee State University who help to student to explore campus resources".
+                        
+                        Your task is to:
+                        - Not to answer any other context questions - example joke, explicit content, news, internet topics, trends, songs etc.
+                        - Answer the User question: {rewritten_query} **strictly based on the provided Context below.**.
+                        - **Do not fabricate** information not present in the context.
+                        {self.markdown_instruction}
+
+                        Context:
+                        {prompt_context}
+                        """
+ 
+    async def aprepare_query(self, query, history_userquery, timer):
+        """Rewrite stage plus semantic cache lookup, shared by the blocking and streaming pipelines.
+ 
+        The raw query is embedded speculatively while the rewrite and cache lookup run; the
+        embedding is handed on in prepared["embedding_task"] only if the rewrite left the query unchanged.
+        """
+        embedding_task = asyncio.create_task(
+            timer.timed("embed_query", self.retriever.aembed_query(query))
+        )
+        try:
+            with timer.stage("rewrite"):
+                rewritten_query, rewrite_source = await self.aresolve_query(query, history_userquery)
+        except BaseException:
+            embedding_task.cancel()
+            raise
+ 
+        if rewritten_query.strip() != query.strip():
+            embedding_task.cancel()
+            embedding_task = None
+ 
+        prepared = {"rewritten_query": rewritten_query, "rewrite_source": rewrite_source,
+                    "cache_vector": None, "cached": None, "embedding_task": embedding_task}
+ 
+        # Serve near-duplicate questions from the semantic cache
+        if self.answer_cache:
+            with timer.stage("cache_lookup"):
+                cached, similarity, prepared["cache_vector"] = await run_in_executor(
+                    self.answer_cache.lookup, rewritten_query
+                )
+            if cached:
+                if embedding_task:
+                    embedding_task.cancel()
+                decorated_text, top_n_document, citation_data, context_data, token_processing_details_holder = cached
+                token_processing_details_holder = dict(token_processing_details_holder)
+                token_processing_details_holder["Semantic Cache"] = dict(
+                    self.answer_cache.stats(), hit=True, similarity=round(similarity, 4),
+                    latency_saved=round(token_processing_details_holder.get("Pipeline-Time", 0.0), 3)
+                )
+                token_processing_details_holder["Stage-Timings"] = timer.as_dict()
+                token_processing_details_holder["Rewrite"] = rewrite_source
+                prepared["cached"] = (decorated_text, top_n_document, citation_data, context_data,
+                                      token_processing_details_holder)
+        return prepared
+ 
+    async def aretrieve_context(self, rewritten_query, timer, embedding_task=None, score_threshold=None):
+        """Retrieve-and-rerank stage; returns the documents, citations, context, packed prompt context and a fresh details holder."""
+        query_embedding = None
+        if embedding_task:
+            try:
+                query_embedding = await embedding_task
+            except Exception as e:
+                # Fall back to embedding inside the retriever
+                logging.getLogger(__name__).warning(f"Speculative query embedding failed: {e}")
+ 
+        retrieval_details = {}
+        with timer.stage("retrieve"):
+            top_n_document, citation_data, context_data = await self.retriever.aretrieve_and_rerank(
+                rewritten_query, query_embedding=query_embedding, score_threshold=score_threshold,
+                details=retrieval_details
+            )
+ 
+        with timer.stage("pack_context"):
+            prompt_context, packing_details = self.context_packer.pack(top_n_document)
+            total_token_count = self.count_tokens(context_data)
+        token_processing_details_holder = {
+            "Token Count": total_token_count,
+            "Context Packing": packing_details,
+            "Embedding Cache": self.retriever.openai_ef.stats()
+        }
+        token_processing_details_holder.update(retrieval_details)
+        if self.retriever.score_cache:
+            token_processing_details_holder["Rerank Cache"] = self.retriever.score_cache.stats()
+        return top_n_document, citation_data, context_data, prompt_context, token_processing_details_holder
+ 
+    async def afinalize_response(self, prepared, generated_text, top_n_document, citation_data, context_data,
+                          token_processing_details_holder, timer, pipeline_start):
+        """Decorate stage, timing report and semantic cache store."""
+        # Decorate generated text with Markdown
+        with timer.stage("decorate"):
+            decorated_text = await self.adecorate_text(generated_text, prepared["rewritten_query"], context_data)
+ 
+        token_processing_details_holder["Pipeline-Time"] = time.time() - pipeline_start
+        token_processing_details_holder["Decorate-Mode"] = self.decorate_mode
+        token_processing_details_holder["Rewrite"] = prepared["rewrite_source"]
+        token_processing_details_holder["Stage-Timings"] = timer.as_dict()
+        if self.answer_cache:
+            self.answer_cache.store(
+                prepared["cache_vector"],
+                (decorated_text, top_n_document, citation_data, context_data, dict(token_processing_details_holder)),
+                token_processing_details_holder["Pipeline-Time"]
+            )
+            token_processing_details_holder["Semantic Cache"] = dict(self.answer_cache.stats(), hit=False)
+ 
         return decorated_text
  
-    def generate_filtered_response(self, query, history_userquery, rerank_score_threshold=-5):
+    def generate_filtered_response(self, query, history_userquery, rerank_score_threshold=RETRIEVAL_SCORE_THRESHOLD):
         """Generates a response using retrieved documents and decorates the final text."""
-        # Rewrite query
-        rewritten_query = self.rewrite_query(query, history_userquery)
+        return run_async(self.agenerate_filtered_response(query, history_userquery, rerank_score_threshold))
+ 
+    async def agenerate_filtered_response(self, query, history_userquery, rerank_score_threshold=RETRIEVAL_SCORE_THRESHOLD):
+        """Async pipeline behind generate_filtered_response."""
+        timer = StageTimer()
+ 
+        prepared = await self.aprepare_query(query, history_userquery, timer)
+        if prepared["cached"]:
+            return prepared["cached"]
+        rewritten_query = prepared["rewritten_query"]
+ 
+        pipeline_start = time.time()
  
         # Retrieve and rerank
-        top_n_document, citation_data, context_data = self.retriever.retrieve_and_rerank(
-            rewritten_query
+        top_n_document, citation_data, context_data, prompt_context, token_processing_details_holder = await self.aretrieve_context(
+            rewritten_query, timer, prepared["embedding_task"], rerank_score_threshold
         )
  
-        total_token_count = self.count_tokens(context_data)
-        token_processing_details_holder = {"Token Count": total_token_count}
- 
         generation_kwargs = {
             "max_tokens": 500,
             "echo": False,
@@ -87,45 +277,158 @@ class ResponseLLM:
         start_time = time.time()
  
         if llmChoiceGPT:
-            completion = self.client.chat.completions.create(
+            completion = await get_async_openai().chat.completions.create(
                 model="gpt-4o-mini",
                 messages=[
                     {
                         "role": "user",
-                        "content": f"""
-                
-                        Your identity is: "BucAIDE - conversational and context-aware QnA platform for East Tennessee State University who help to student to explore campus resources".
-                        
-                        Your task is to:
-                        - Not to answer any other context questions - example joke, explicit content, news, internet topics, trends, songs etc.
-                        - Answer the User question: {rewritten_query} **strictly based on the provided Context: {top_n_document}.**.
-                        - **Do not fabricate** information not present in the context.
-                        """ 
+                        "content": self.build_generation_prompt(rewritten_query, prompt_context)
                     }
                 ]
             )
             generated_text = completion.choices[0].message.content
+            timer.record("generate", time.time() - start_time)
+            token_processing_details_holder["Usage"] = usage_details(completion.usage)
             token_processing_details_holder.update(
                 {"Process-Time": time.time() - start_time, "Model": "GPT 4o Mini"})
         else:
             # Ollama fallback (local)
             import ollama
-            response = ollama.chat(
+            response = await ollama.AsyncClient().chat(
                 model="llama2",
                 options=generation_kwargs,
                 messages=[
                     {
                         "role": "user",
-                        "content": f"You are ETSU's conversational and context-aware QnA system. Answer the {query} strictly based on the following information only: {top_n_document}. If explicit/rough/sensitive language is detected in the query, respond saying 'Explicit language is prohibited.'"
+                        "content": f"You are ETSU's conversational and context-aware QnA system. Answer the {query} strictly based on the following information only: {prompt_context}. If explicit/rough/sensitive language is detected in the query, respond saying 'Explicit language is prohibited.'"
                     }
                 ]
             )
             generated_text = response["message"]["content"]
+            timer.record("generate", time.time() - start_time)
             token_processing_details_holder.update(
                 {"Process-Time": time.time() - start_time, "Model": "Ollama2- Local Server"})
  
-        # Decorate generated text with Markdown
-        decorated_text = self.decorate_text(generated_text)
+        decorated_text = await self.afinalize_response(
+            prepared, generated_text, top_n_document, citation_data, context_data,
+            token_processing_details_holder, timer, pipeline_start
+        )
  
         return decorated_text, top_n_document, citation_data, context_data, token_processing_details_holder
- 
\ No newline at end of file
+ 
+    def stream_filtered_response(self, query, history_userquery):
+        """Streaming variant of generate_filtered_response.
+ 
+        Yields (event, data) pairs: one "citations" event as soon as retrieval finishes, a "token"
+        event per completion delta, and a final "done" event carrying the same values
+        generate_filtered_response returns.
+        """
+        return iterate_async(self.astream_filtered_response(query, history_userquery))
+ 
+    async def astream_filtered_response(self, query, history_userquery):
+        """Async generator behind stream_filtered_response."""
+        timer = StageTimer()
+ 
+        prepared = await self.aprepare_query(query, history_userquery, timer)
+        if prepared["cached"]:
+            decorated_text, top_n_document, citation_data, context_data, token_processing_details_holder = prepared["cached"]
+            yield "citations", {"citation_data": citation_data, "documents": top_n_document}
+            yield "token", {"text": decorated_text}
+            yield "done", {"llmresponse": decorated_text, "top_n_document": top_n_document,
+                           "citation_data": citation_data, "context_data": context_data,
+                           "token_details": token_processing_details_holder}
+            return
+        rewritten_query = prepared["rewritten_query"]
+ 
+        pipeline_start = time.time()
+ 
+        top_n_document, citation_data, context_data, prompt_context, token_processing_details_holder = await self.aretrieve_context(
+            rewritten_query, timer, prepared["embedding_task"]
+        )
+        yield "citations", {"citation_data": citation_data, "documents": top_n_document}
+ 
+        start_time = time.time()
+        stream = await get_async_openai().chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {
+                    "role": "user",
+                    "content": self.build_generation_prompt(rewritten_query, prompt_context)
+                }
+            ],
+            stream=True,
+            # The final chunk then reports exact prompt/completion token counts
+            stream_options={"include_usage": True}
+        )
+        parts = []
+        async for chunk in stream:
+            if chunk.usage:
+                token_processing_details_holder["Usage"] = usage_details(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not parts:
+                    token_processing_details_holder["Time-To-First-Token"] = time.time() - start_time
+                parts.append(delta)
+                yield "token", {"text": delta}
+        generated_text = "".join(parts)
+        timer.record("generate", time.time() - start_time)
+        token_processing_details_holder.update(
+            {"Process-Time": time.time() - start_time, "Model": "GPT 4o Mini"})
+ 
+        # Decoration (if any) applies to the complete answer, which the client swaps in on "done"
+        decorated_text = await self.afinalize_response(
+            prepared, generated_text, top_n_document, citation_data, context_data,
+            token_processing_details_holder, timer, pipeline_start
+        )
+ 
+        yield "done", {"llmresponse": decorated_text, "top_n_document": top_n_document,
+                       "citation_data": citation_data, "context_data": context_data,
+                       "token_details": token_processing_details_holder}
+ 
+ 
+def usage_details(usage):
+    """Exact token counts reported by the OpenAI API for one completion."""
+    if usage is None:
+        return None
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens
+    }
+
+
+_response_llm = None
+_response_llm_lock = threading.Lock()
+_model_state = {"loaded": False, "warm": False, "load_seconds": None, "warmup_seconds": None}
+ 
+ 
+def get_response_llm():
+    """Process-wide ResponseLLM, built on first use (or up front by create_app when PRELOAD_MODELS is set)."""
+    global _response_llm
+    with _response_llm_lock:
+        if _response_llm is None:
+            start_time = time.time()
+            _response_llm = ResponseLLM()
+            _model_state.update(loaded=True, load_seconds=round(time.time() - start_time, 3))
+    return _response_llm
+ 
+ 
+def warmup_models():
+    """Run one tiny inference per local model in this process so the first chat does not pay for lazy init."""
+    response_llm = get_response_llm()
+    start_time = time.time()
+    response_llm.similarity_model.encode(["warmup"])
+    response_llm.retriever.reranker.predict([("warmup", "warmup")])
+    _model_state.update(warm=True, warmup_seconds=round(time.time() - start_time, 3))
+    logging.getLogger(__name__).info(f"Models warm in process {os.getpid()}")
+ 
+ 
+def start_warmup():
+    # Runs after fork (gunicorn post_fork) so no inference threads are created in the master
+    threading.Thread(target=warmup_models, name="model-warmup", daemon=True).start()
+ 
+ 
+def model_status():
+    return dict(_model_state, ready=_model_state["warm"], pid=os.getpid())
@@ -1,55 +1,237 @@
 import json
 import os
- 
- 
+import time
+import fcntl
+import atexit
+import logging
+import threading
+from collections import deque
+import zstandard
+from config import (
+    RESPONSE_LOG_MAX_BYTES, RESPONSE_LOG_ROTATE_SECONDS, RESPONSE_LOG_COMPRESS, RESPONSE_LOG_FLUSH_SECONDS,
+    RESPONSE_LOG_BUFFER_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+
+class JsonLinesWriter:
+    """Buffered, append-only JSON Lines file shared safely by every worker process.
+
+    append() only serializes the record and queues the line; a per-process background
+    thread writes queued lines under an exclusive flock. The file is rotated when it grows
+    past max_bytes or when the rotation interval rolls over, and rotated segments are
+    zstd-compressed. If the buffer is full the oldest lines are dropped (and counted).
+    """
+
+    def __init__(self, path, max_bytes=RESPONSE_LOG_MAX_BYTES, rotate_seconds=RESPONSE_LOG_ROTATE_SECONDS,
+                 compress=RESPONSE_LOG_COMPRESS, flush_seconds=RESPONSE_LOG_FLUSH_SECONDS,
+                 buffer_size=RESPONSE_LOG_BUFFER_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compress = compress
+        self.flush_seconds = flush_seconds
+        self._buffer = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self.counters = {"written": 0, "dropped": 0, "rotations": 0}
+
+        dir_path = os.path.dirname(path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+
+    def append(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self._pid != os.getpid():
+                # Lines buffered before a fork belong to the parent
+                self._buffer.clear()
+                threading.Thread(target=self._run, name="response-log-writer", daemon=True).start()
+                self._pid = os.getpid()
+            if len(self._buffer) == self._buffer.maxlen:
+                self.counters["dropped"] += 1
+            self._buffer.append(line)
+            if len(self._buffer) >= self._buffer.maxlen // 2:
+                self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Failed to write {self.path}: {e}", exc_info=True)
+
+    def flush(self):
+        with self._lock:
+            lines = list(self._buffer)
+            self._buffer.clear()
+        if not lines:
+            return
+
+        rotated = None
+        file = self._open_locked()
+        try:
+            if self._should_rotate(file):
+                rotated = self._rotate()
+                file.close()
+                file = self._open_locked()
+            file.write("".join(lines))
+            file.flush()
+        finally:
+            file.close()  # Releases the flock
+        self.counters["written"] += len(lines)
+
+        if rotated and self.compress:
+            compress_segment(rotated)
+
+    def _open_locked(self):
+        """Open the live file under an exclusive lock, retrying if another worker rotated it meanwhile."""
+        while True:
+            file = open(self.path, "a", encoding="utf-8")
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                if os.stat(self.path).st_ino == os.fstat(file.fileno()).st_ino:
+                    return file
+            except FileNotFoundError:
+                pass
+            file.close()
+
+    def _should_rotate(self, file):
+        stat = os.fstat(file.fileno())
+        if stat.st_size == 0:
+            return False
+        if stat.st_size >= self.max_bytes:
+            return True
+        return self.rotate_seconds > 0 and int(stat.st_mtime // self.rotate_seconds) != int(time.time() // self.rotate_seconds)
+
+    def _rotate(self):
+        rotated = f"{self.path}.{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        os.replace(self.path, rotated)
+        self.counters["rotations"] += 1
+        return rotated
+
+
+def compress_segment(path):
+    """Compress a rotated segment to path.zst and remove the original."""
+    tmp_path = f"{path}.zst.tmp"
+    try:
+        with open(path, "rb") as source, open(tmp_path, "wb") as target:
+            zstandard.ZstdCompressor(level=10).copy_stream(source, target)
+        os.replace(tmp_path, f"{path}.zst")
+        os.remove(path)
+    except OSError as e:
+        logger.error(f"Failed to compress {path}: {e}")
+
+
+def iter_log_records(path, chunk_size=1 << 16):
+    """Stream records from a response log: JSON Lines (.jsonl, rotated or .zst) or a legacy JSON array."""
+    if path.endswith(".zst"):
+        with open(path, "rb") as raw, zstandard.ZstdDecompressor().stream_reader(raw) as reader:
+            buffered = b""
+            while True:
+                chunk = reader.read(chunk_size)
+                if not chunk:
+                    break
+                buffered += chunk
+                *lines, buffered = buffered.split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+            if buffered.strip():
+                yield json.loads(buffered)
+        return
+
+    with open(path, "r", encoding="utf-8") as file:
+        first = file.read(1)
+        while first and first.isspace():
+            first = file.read(1)
+        if first != "[":
+            file.seek(0)
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        yield from _iter_json_array(file, chunk_size)
+
+
+def _iter_json_array(file, chunk_size):
+    """Incrementally decode the elements of a JSON array whose opening '[' was already consumed."""
+    decoder = json.JSONDecoder()
+    buffered = ""
+    position = 0
+    eof = False
+    while True:
+        # Skip separators between elements
+        while position < len(buffered) and buffered[position] in " \t\r\n,":
+            position += 1
+        if position < len(buffered) and buffered[position] == "]":
+            return
+        try:
+            record, end = decoder.raw_decode(buffered, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffered = buffered[position:] + chunk
+            position = 0
+            continue
+        # A record ending exactly at the buffer edge may be a truncated number; read more first
+        if end == len(buffered) and not eof:
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffered = buffered[position:] + chunk
+            position = 0
+            continue
+        yield record
+        position = end
+
+
 class ResponseLogger:
-    def __init__(self, response_file="logs/response_data.json", timestamp_file="logs/response_timestamp.json"):
+    def __init__(self, response_file="logs/response_data.jsonl", timestamp_file="logs/response_timestamp.jsonl"):
         self.response_file = response_file
         self.timestamp_file = timestamp_file
- 
-        # FIX: Auto-create log directories if they don't exist
-        for filepath in [self.response_file, self.timestamp_file]:
-            dir_path = os.path.dirname(filepath)
-            if dir_path:
-                os.makedirs(dir_path, exist_ok=True)
- 
+
+        # Directories are created by the writers
+        self.response_writer = JsonLinesWriter(response_file)
+        self.timestamp_writer = JsonLinesWriter(timestamp_file)
+        atexit.register(self.flush)
+
     def append_to_json_file(self, response_data_holder):
+        """Queue one response record; constant cost regardless of the log size."""
         try:
-            if os.path.exists(self.response_file) and os.path.getsize(self.response_file) > 0:
-                with open(self.response_file, "r+") as file:
-                    try:
-                        data = json.load(file)
-                    except json.JSONDecodeError:
-                        data = []
-                    data.append(response_data_holder)
-                    file.seek(0)
-                    json.dump(data, file, indent=4)
-                    file.truncate()
-            else:
-                with open(self.response_file, "w") as file:
-                    json.dump([response_data_holder], file, indent=4)
-        except OSError as e:
-            print(f"Error accessing file {self.response_file}: {e}")
+            self.response_writer.append(response_data_holder)
         except Exception as e:
-            print(f"An unexpected error occurred: {e}")
- 
+            logger.error(f"Failed to queue response log record: {e}")
+
     def time_stamp_append_to_json_file(self, response_data_holder):
         try:
-            if os.path.exists(self.timestamp_file) and os.path.getsize(self.timestamp_file) > 0:
-                with open(self.timestamp_file, "r+") as file:
-                    try:
-                        data = json.load(file)
-                    except json.JSONDecodeError:
-                        data = []
-                    data.append(response_data_holder)
-                    file.seek(0)
-                    json.dump(data, file, indent=4)
-                    file.truncate()
-            else:
-                with open(self.timestamp_file, "w") as file:
-                    json.dump([response_data_holder], file, indent=4)
-        except OSError as e:
-            print(f"Error accessing file {self.timestamp_file}: {e}")
+            self.timestamp_writer.append(response_data_holder)
         except Exception as e:
-            print(f"An unexpected error occurred: {e}")
- 
\ No newline at end of file
+            logger.error(f"Failed to queue timestamp log record: {e}")
+
+    def flush(self):
+        for writer in (self.response_writer, self.timestamp_writer):
+            try:
+                writer.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush {writer.path}: {e}")
+
+    def stats(self):
+        return {
+            "response": dict(self.response_writer.counters, buffered=len(self.response_writer._buffer)),
+            "timestamp": dict(self.timestamp_writer.counters, buffered=len(self.timestamp_writer._buffer))
+        }
+
+
+if __name__ == "__main__":
+    # Convert any response log (legacy JSON array, JSON Lines or a .zst segment) to JSON Lines on stdout
+    import sys
+
+    for log_path in sys.argv[1:]:
+        for log_record in iter_log_records(log_path):
+            sys.stdout.write(json.dumps(log_record) + "\n")
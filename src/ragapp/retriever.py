@@ -1,10 +1,23 @@
 import os
+import time
+import asyncio
 import logging
-from sentence_transformers import CrossEncoder
-import chromadb
-from chromadb.utils import embedding_functions
-from chromadb.config import Settings
-from config import OPENAI_API_KEY, COLLECTION_NAME, RERANKER_MODEL, EMBEDDING_MODEL_NAME
+import threading
+from ragapp.reranker import load_reranker
+from ragapp.scorecache import RerankScoreCache
+from config import (
+    EMBEDDING_MODEL_NAME, RERANK_CACHE_SIZE, HYBRID_RETRIEVAL, HYBRID_VECTOR_K,
+    HYBRID_LEXICAL_K, HYBRID_RRF_K, HYBRID_RERANK_CANDIDATES, VECTOR_BACKEND,
+    RETRIEVAL_ADAPTIVE, RETRIEVAL_SCORE_THRESHOLD, RETRIEVAL_MIN_CHUNKS, RETRIEVAL_MAX_CHUNKS,
+    RETRIEVAL_SEPARATION_MARGIN, RETRIEVAL_LOW_SCORE, RETRIEVAL_WIDEN_K, RETRIEVAL_LATENCY_BUDGET_MS,
+    RETRIEVAL_WIDEN_BUDGET_MS, BM25_INDEX_PATH, LOCAL_INDEX_DIR
+)
+from chromvec.embedcache import get_embedding_function
+from chromvec.manifest import current_index_version
+from chromvec.bm25 import BM25Index, reciprocal_rank_fusion
+from chromvec.localindex import LocalVectorIndex, CHUNKS_FILE
+from chromvec.store import get_vector_store, VectorStoreUnavailable
+from ragapp.asyncsupport import get_async_openai, run_async, run_in_executor
 
 # Configure logging
 logging.basicConfig(
@@ -17,6 +30,81 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Weight of the newest measurement in the rolling per-pair cost of uncached reranking
+RERANK_COST_SMOOTHING = 0.2
+
+
+def file_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class ReloadingIndex:
+    """An index file written by the ingestion job, reloaded off the request path after a re-index.
+
+    A reload is due when the manifest's index version changes, or when the file changes while
+    the loaded copy's index_version disagrees with the manifest; a mismatched file is not read
+    again until one of the two moves. The first load blocks if block_first_load is set,
+    otherwise get() returns None until it is done. Later reloads run on a background thread
+    while get() keeps returning the previous copy. A copy whose version does not match the
+    manifest is only served if serve_mismatched is set.
+    """
+
+    def __init__(self, name, path, load, serve_mismatched, block_first_load):
+        self.name = name
+        self.path = path
+        self.load = load
+        self.serve_mismatched = serve_mismatched
+        self.block_first_load = block_first_load
+        self._value = None
+        self._loaded = None  # (manifest version, file mtime, matched) of the last load
+        self._loading_pid = None
+        self._lock = threading.Lock()
+
+    def _due(self, version):
+        if self._loaded is None:
+            return True
+        loaded_version, loaded_mtime, matched = self._loaded
+        return version != loaded_version or (not matched and file_mtime(self.path) != loaded_mtime)
+
+    def get(self):
+        version = current_index_version()
+        with self._lock:
+            # A loading thread started before a fork does not exist in this process
+            if self._loading_pid == os.getpid() or not self._due(version):
+                return self._value
+            if self._loaded is None and self.block_first_load:
+                self._reload(version)
+                return self._value
+            self._loading_pid = os.getpid()
+        threading.Thread(target=self._reload_in_background, args=(version,), name=f"reload-{self.name}",
+                         daemon=True).start()
+        return self._value
+
+    def _reload_in_background(self, version):
+        try:
+            self._reload(version)
+        except Exception as e:
+            logger.error(f"Reloading the {self.name} failed: {e}", exc_info=True)
+            self._loaded = (version, file_mtime(self.path), False)
+        finally:
+            self._loading_pid = None
+
+    def _reload(self, version):
+        # The mtime is taken first, so a file replaced during the load is read again
+        mtime = file_mtime(self.path)
+        value = self.load()
+        matched = value is not None and value.index_version == version
+        if value is not None and not matched:
+            logger.warning(f"{self.name} version {value.index_version} does not match the manifest ({version}); "
+                           f"{'serving it' if self.serve_mismatched else 'not using it'} until either changes")
+        elif value is not None:
+            logger.info(f"Loaded {self.name} with {len(value)} chunks")
+        self._value = value if matched or self.serve_mismatched else None
+        self._loaded = (version, mtime, matched)
+
 
 class Retriever:
     def __init__(self):
@@ -26,54 +114,244 @@ class Retriever:
         # # Set up the dataset path and initialize the ChromaDB persistent client
         # os.makedirs(DATASET_PATH, exist_ok=True)
 
-        # Ensure consistent settings for PersistentClient
-        self.client = chromadb.HttpClient(
-            host="chroma",
-            port=8000,
-            settings=Settings(allow_reset=True, anonymized_telemetry=False)
+        # Load the cross-encoder reranker (ONNX/int8 by default, micro-batched across requests)
+        self.reranker = load_reranker()
+        self.score_cache = RerankScoreCache() if RERANK_CACHE_SIZE > 0 else None
+        # Rolling cross-encoder milliseconds per uncached pair, used to budget the widening rerank
+        self._rerank_ms_per_pair = None
+        # Choose how many reranked chunks to keep (and whether to widen) from the score distribution
+        self.adaptive = RETRIEVAL_ADAPTIVE
+
+        # BM25 index written by the ingestion job, loaded lazily and reloaded after a re-index
+        self.hybrid = HYBRID_RETRIEVAL
+        self._lexical = ReloadingIndex(
+            "BM25 index", BM25_INDEX_PATH, BM25Index.load, serve_mismatched=True, block_first_load=True
+        )
+
+        # In-process copy of the collection's vectors when VECTOR_BACKEND is "local"
+        self.vector_backend = VECTOR_BACKEND
+        # Loaded in the background so queries never read it on the event loop; until an export
+        # matching the manifest is loaded, queries go to ChromaDB
+        self._local = ReloadingIndex(
+            "local vector index", os.path.join(LOCAL_INDEX_DIR, CHUNKS_FILE), LocalVectorIndex.load,
+            serve_mismatched=False, block_first_load=False
         )
 
-        # Load the cross-encoder reranker model
-        self.reranker = CrossEncoder(RERANKER_MODEL)
+        # Initialize OpenAI embedding function (cached, shared with ingestion)
+        self.openai_ef = get_embedding_function()
+
+        # Shared Chroma access layer (pooled client, cached collection handle, circuit breaker)
+        self.store = get_vector_store()
 
-        # Initialize OpenAI embedding function
-        self.openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=OPENAI_API_KEY,
-            model_name=EMBEDDING_MODEL_NAME
+    async def aembed_texts(self, texts):
+        """Embed texts with the pooled async OpenAI client (same input handling as OpenAIEmbeddingFunction)."""
+        response = await get_async_openai().embeddings.create(
+            model=EMBEDDING_MODEL_NAME,
+            input=[text.replace("\n", " ") for text in texts]
         )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def aembed_query(self, query):
+        """Query embedding through the shared embedding cache; only misses reach OpenAI."""
+        return await self.openai_ef.acall([query], self.aembed_texts)
 
-    def retrieve_and_rerank(self, query, top_k=7):
+    def local_index(self):
+        """The exported local vector index, or None while no export matching the manifest is loaded."""
+        return self._local.get()
+
+    async def aquery_collection(self, query_embedding, top_k):
+        """Retrieve top-K initial results from ChromaDB using HNSW and cosine similarity."""
+        if self.vector_backend == "local":
+            local_index = self.local_index()
+            if local_index is not None:
+                # Exact dot product over a few thousand memory-mapped vectors; cheaper than a thread hop
+                return local_index.query(query_embedding, top_k)
+            logger.warning("Local vector index not loaded; querying ChromaDB")
+        return await self.store.aquery(query_embedding, top_k)
+
+    async def aquery_vectors_or_empty(self, query_embedding, top_k):
+        """Vector query for hybrid mode; while ChromaDB is failing, BM25 alone keeps retrieval working."""
+        try:
+            return await self.aquery_collection(query_embedding, top_k)
+        except Exception as e:
+            if not isinstance(e, VectorStoreUnavailable):
+                logger.error(f"Vector query failed, using lexical results only: {e}")
+            return {"ids": [[]], "documents": [[]], "metadatas": [[]]}
+
+    async def aretrieve_and_rerank(self, query, top_k=7, query_embedding=None, score_threshold=None, details=None):
         """
         Retrieves the top K documents based on cosine similarity to the query and
         reranks them using a cross-encoder for improved relevance.
-        """
-        # Load the specified collection from ChromaDB
-        collection = self.client.get_collection(COLLECTION_NAME)
 
+        In adaptive mode the number of chunks kept follows the rerank scores (see select_depth)
+        and a query whose best score is below RETRIEVAL_LOW_SCORE is retried against a wider
+        candidate pool, within the latency budgets. details, if given, receives a
+        "Retrieval-Depth" report.
+        """
+        start_time = time.perf_counter()
         # Generate embedding for the user query
-        query_embedding = self.openai_ef([query])
+        if query_embedding is None:
+            query_embedding = await self.aembed_query(query)
 
-        # Retrieve top-K initial results from ChromaDB using HNSW and cosine similarity
-        initial_results = collection.query(
-            query_embeddings=query_embedding,
-            n_results=top_k
-        )
+        documents, metadata, ids = await self.afetch_candidates(query, query_embedding, top_k)
+        # Cross-encoder inference is CPU-bound; keep it off the event loop
+        ranked = await run_in_executor(self.rank_candidates, query, documents, metadata, ids)
+        if not self.adaptive:
+            return self.build_results(ranked[:RETRIEVAL_MAX_CHUNKS])
+
+        depth = {"candidates": len(ranked), "widened": False}
+        if ranked and ranked[0][2] < RETRIEVAL_LOW_SCORE:
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
+            if elapsed_ms < RETRIEVAL_LATENCY_BUDGET_MS:
+                deadline = time.perf_counter() + RETRIEVAL_WIDEN_BUDGET_MS / 1000
+                widened = await self.awiden(query, query_embedding, ranked, deadline)
+                if widened is None:
+                    logger.warning(f"Widened retrieval would exceed {RETRIEVAL_WIDEN_BUDGET_MS} ms; keeping first pass")
+                    depth["widen_timed_out"] = True
+                else:
+                    ranked = widened
+                    depth.update(widened=True, candidates=len(ranked))
+            else:
+                depth["widen_skipped_ms"] = round(elapsed_ms, 1)
+
+        threshold = RETRIEVAL_SCORE_THRESHOLD if score_threshold is None else score_threshold
+        selected = self.select_depth(ranked, threshold)
+        if details is not None:
+            details["Retrieval-Depth"] = dict(
+                depth,
+                kept=len(selected),
+                top_score=round(ranked[0][2], 3) if ranked else None,
+                threshold=threshold,
+                retrieval_ms=round((time.perf_counter() - start_time) * 1000, 1)
+            )
+        return self.build_results(selected)
+
+    async def afetch_candidates(self, query, query_embedding, top_k, rerank_limit=HYBRID_RERANK_CANDIDATES):
+        """Candidate (documents, metadata, ids) from the vector index, fused with BM25 hits in hybrid mode."""
+        if self.hybrid:
+            initial_results, lexical_hits = await asyncio.gather(
+                self.aquery_vectors_or_empty(query_embedding, max(top_k, HYBRID_VECTOR_K)),
+                run_in_executor(self.lexical_search, query, max(top_k, HYBRID_LEXICAL_K))
+            )
+        else:
+            initial_results = await self.aquery_collection(query_embedding, top_k)
+            lexical_hits = []
 
         documents = initial_results['documents'][0]
-        ids = initial_results['ids'][0]
         metadata = initial_results.get('metadatas', [])[0]
+        ids = initial_results['ids'][0]
+        if self.hybrid:
+            documents, metadata, ids = self.fuse_candidates(documents, metadata, ids, lexical_hits, limit=rerank_limit)
+        return documents, metadata, ids
+
+    async def awiden(self, query, query_embedding, ranked, deadline):
+        """Fetch RETRIEVAL_WIDEN_K candidates, rerank the ones not scored yet and merge them into ranked.
+
+        Work that has started is never cancelled: before the rerank its cost is estimated
+        (see estimate_rerank_ms), and None is returned if it would not finish by deadline.
+        """
+        documents, metadata, ids = await self.afetch_candidates(
+            query, query_embedding, RETRIEVAL_WIDEN_K, rerank_limit=RETRIEVAL_WIDEN_K
+        )
+        seen = {chunk_id for _, _, _, chunk_id in ranked}
+        fresh = [idx for idx, chunk_id in enumerate(ids) if chunk_id not in seen]
+        if not fresh:
+            return ranked
+        remaining_ms = (deadline - time.perf_counter()) * 1000
+        if self.estimate_rerank_ms(query, [ids[idx] for idx in fresh]) > remaining_ms:
+            return None
+        more = await run_in_executor(
+            self.rank_candidates, query, [documents[idx] for idx in fresh], [metadata[idx] for idx in fresh],
+            [ids[idx] for idx in fresh]
+        )
+        return sorted(ranked + more, key=lambda x: x[2], reverse=True)
+
+    def select_depth(self, ranked, threshold):
+        """Adaptive cut of the ranked (doc, meta, score, id) list.
+
+        Drops chunks below threshold and chunks more than RETRIEVAL_SEPARATION_MARGIN below
+        the best one, so a clearly separated top hit is sent alone while evenly scored
+        candidates are all kept (up to RETRIEVAL_MAX_CHUNKS). At least RETRIEVAL_MIN_CHUNKS
+        are always returned.
+        """
+        kept = [item for item in ranked if item[2] >= threshold]
+        if kept:
+            best = kept[0][2]
+            kept = [item for item in kept if best - item[2] <= RETRIEVAL_SEPARATION_MARGIN]
+        kept = kept[:RETRIEVAL_MAX_CHUNKS]
+        if len(kept) < RETRIEVAL_MIN_CHUNKS:
+            kept = ranked[:RETRIEVAL_MIN_CHUNKS]
+        return kept
+
+    def lexical_index(self):
+        """The persisted BM25 index; after a re-index the new one is loaded in the background."""
+        return self._lexical.get()
+
+    def lexical_search(self, query, top_k):
+        return self.lexical_index().search(query, top_k)
+
+    def fuse_candidates(self, documents, metadata, ids, lexical_hits, limit=HYBRID_RERANK_CANDIDATES):
+        """Reciprocal-rank fusion of the vector and BM25 rankings, trimmed to the rerank candidate budget."""
+        candidates = {chunk_id: (doc, meta) for chunk_id, doc, meta in zip(ids, documents, metadata)}
+        index = self.lexical_index()
+        for chunk_id, _ in lexical_hits:
+            if chunk_id not in candidates:
+                candidates[chunk_id] = index.get(chunk_id)
+
+        fused = reciprocal_rank_fusion([ids, [chunk_id for chunk_id, _ in lexical_hits]], k=HYBRID_RRF_K)
+        fused = [chunk_id for chunk_id in fused if candidates[chunk_id][0] is not None][:limit]
+        return [candidates[cid][0] for cid in fused], [candidates[cid][1] for cid in fused], fused
+
+    def estimate_rerank_ms(self, query, ids):
+        """Expected cross-encoder time for ids: cache misses times the rolling per-pair cost."""
+        if self._rerank_ms_per_pair is None:
+            return 0.0
+        if self.score_cache is not None:
+            cached = self.score_cache.lookup(query, ids)
+            ids = [chunk_id for chunk_id in ids if chunk_id not in cached]
+        return len(ids) * self._rerank_ms_per_pair
+
+    def rerank_pairs(self, pairs):
+        """reranker.predict, timed to keep the rolling per-pair cost of uncached pairs."""
+        start_time = time.perf_counter()
+        scores = self.reranker.predict(pairs)
+        if pairs:
+            ms_per_pair = (time.perf_counter() - start_time) * 1000 / len(pairs)
+            previous = self._rerank_ms_per_pair
+            self._rerank_ms_per_pair = ms_per_pair if previous is None else \
+                previous + RERANK_COST_SMOOTHING * (ms_per_pair - previous)
+        return scores
+
+    def score_documents(self, query, documents, ids=None):
+        """Cross-encoder scores for documents; cached scores are reused and only misses are predicted."""
+        if self.score_cache is None or ids is None:
+            return self.rerank_pairs([(query, doc) for doc in documents])
+
+        cached = self.score_cache.lookup(query, ids)
+        missing = [idx for idx, chunk_id in enumerate(ids) if chunk_id not in cached]
+        if missing:
+            # Perform reranking using the cross-encoder
+            predicted = self.rerank_pairs([(query, documents[idx]) for idx in missing])
+            fresh = {ids[idx]: float(score) for idx, score in zip(missing, predicted)}
+            self.score_cache.store(query, fresh)
+            cached.update(fresh)
+        return [cached[chunk_id] for chunk_id in ids]
 
-        # Prepare pairs for reranking using document content
-        pairs = [(query, doc) for doc in documents]
+    def retrieve_and_rerank(self, query, top_k=7, score_threshold=None):
+        """Blocking wrapper around aretrieve_and_rerank."""
+        return run_async(self.aretrieve_and_rerank(query, top_k, score_threshold=score_threshold))
 
-        # Perform reranking using the cross-encoder
-        rerank_scores = self.reranker.predict(pairs)
-        reranked_docs = sorted(
-            zip(documents, metadata, rerank_scores),
+    def rank_candidates(self, query, documents, metadata, ids=None):
+        """Cross-encoder scores for the candidates as (doc, meta, score, id) tuples, best first."""
+        rerank_scores = self.score_documents(query, documents, ids)
+        return sorted(
+            zip(documents, metadata, rerank_scores, ids or [None] * len(documents)),
             key=lambda x: x[2],
             reverse=True
         )
 
+    def build_results(self, reranked_docs):
+        """Builds the result, citation and context lists from ranked (doc, meta, score, id) tuples."""
         # Extract the top reranked documents
         top_n_results = [
             {
@@ -82,7 +360,7 @@ class Retriever:
                 "document_link": meta.get('document_link', 'No link available'),
                 "document_name": meta.get('document_title', 'Name not Available')
             }
-            for doc, meta, score in reranked_docs[:5]
+            for doc, meta, score, _ in reranked_docs
         ]
 
         citation_data = []
@@ -0,0 +1,70 @@
+import re
+import hashlib
+import logging
+import threading
+from cachetools import LRUCache
+from chromvec.manifest import current_index_version
+from config import RERANK_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def query_key(query):
+    """Hash of the query after case and whitespace normalization."""
+    normalized = WHITESPACE_PATTERN.sub(" ", query.strip().lower())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class RerankScoreCache:
+    """Bounded LRU of cross-encoder scores keyed by (normalized query hash, chunk id).
+
+    Chunk ids are content-derived, but the whole cache is still dropped when the
+    index version changes so removed chunks don't linger.
+    """
+
+    def __init__(self, max_entries=RERANK_CACHE_SIZE):
+        self._lock = threading.Lock()
+        self._scores = LRUCache(maxsize=max_entries)
+        self._index_version = current_index_version()
+        self.counters = {"lookups": 0, "hits": 0, "requests": 0, "full_hits": 0}
+
+    def _check_index_version(self):
+        version = current_index_version()
+        if version != self._index_version:
+            logger.info("Collection re-indexed; clearing rerank score cache")
+            with self._lock:
+                self._scores.clear()
+            self._index_version = version
+
+    def lookup(self, query, ids):
+        """Return {chunk_id: score} for the ids that are cached."""
+        self._check_index_version()
+        key = query_key(query)
+        found = {}
+        with self._lock:
+            for chunk_id in ids:
+                score = self._scores.get((key, chunk_id))
+                if score is not None:
+                    found[chunk_id] = score
+            self.counters["lookups"] += len(ids)
+            self.counters["hits"] += len(found)
+            self.counters["requests"] += 1
+            if ids and len(found) == len(ids):
+                self.counters["full_hits"] += 1
+        return found
+
+    def store(self, query, scores):
+        """Store {chunk_id: score} for query."""
+        key = query_key(query)
+        with self._lock:
+            for chunk_id, score in scores.items():
+                self._scores[(key, chunk_id)] = score
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters["entries"] = len(self._scores)
+        counters["hit_rate"] = round(counters["hits"] / counters["lookups"], 4) if counters["lookups"] else 0.0
+        return counters
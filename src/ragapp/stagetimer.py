@@ -0,0 +1,37 @@
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """Collects wall-clock seconds per named pipeline stage for the token details report.
+
+    Stages may overlap (e.g. speculative query embedding during the rewrite), so the
+    per-stage sum can exceed the "wall" entry; the difference is the time saved by overlap.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    async def timed(self, name, awaitable):
+        """Await something (typically as a concurrent task) while recording it as a stage."""
+        with self.stage(name):
+            return await awaitable
+
+    def record(self, name, seconds):
+        self.timings[name] = round(self.timings.get(name, 0.0) + seconds, 4)
+
+    def as_dict(self):
+        timings = dict(self.timings)
+        wall = time.perf_counter() - self.started
+        timings["wall"] = round(wall, 4)
+        timings["overlap"] = round(max(0.0, sum(self.timings.values()) - wall), 4)
+        return timings
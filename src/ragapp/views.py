@@ -1,11 +1,22 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from user.models import User
+from user.signin import jwt_email, is_signed_in
 from datetime import datetime
-from .responseLLM import ResponseLLM
+from concurrent.futures import ThreadPoolExecutor
+from .stagetimer import StageTimer
+from .responseLLM import get_response_llm, model_status
 from .responselog import ResponseLogger
 from extensions import db
-from .models import ChatHistory, ChatConversation, UnauthenticatedSession, ChatFeedback
+from querystats import query_stats
+from .models import ChatHistory, ChatConversation
+from .pagination import (
+    encode_keyset_cursor, decode_keyset_cursor, parse_limit, keyset_page, conversation_rows, next_page_cursor
+)
+from .persistence import write_behind
+from config import (
+    CHAT_HISTORY_MODE, CHAT_HISTORY_DELTA_LIMIT, CHAT_HISTORY_PAGE_SIZE, CHAT_HISTORY_MAX_PAGE_SIZE,
+    CONVERSATIONS_PAGE_SIZE, CONVERSATIONS_MAX_PAGE_SIZE
+)
 import json
 import logging
 from extensions import limiter
@@ -16,10 +27,9 @@ ragapp_bp = Blueprint('ragapp', __name__)
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Initialize ResponseLLM and ResponseLogger
-response_llm = ResponseLLM()
-response_logger = ResponseLogger(response_file="logs/responselogs/response_data.json",
-                                 timestamp_file="logs/responselogs/response_timestamp.json")
+# ResponseLLM is shared per process through get_response_llm(); initialize ResponseLogger
+response_logger = ResponseLogger(response_file="logs/responselogs/response_data.jsonl",
+                                 timestamp_file="logs/responselogs/response_timestamp.jsonl")
 
 def parse_conversation_id(raw):
     # raw can be None, "", "undefined", "null", etc.
@@ -34,6 +44,171 @@ def parse_conversation_id(raw):
     except (TypeError, ValueError):
         return None
 
+# Largest value an INTEGER column accepts
+MAX_INT_COLUMN = 2147483647
+
+
+def parse_optional_int(raw, field):
+    """None for missing values, else a non-negative int that fits an INTEGER column; raises ValueError otherwise."""
+    if raw is None or raw == "":
+        return None
+    if isinstance(raw, bool):
+        raise ValueError(f"{field} must be an integer")
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be an integer")
+    if not 0 <= value <= MAX_INT_COLUMN:
+        raise ValueError(f"{field} is out of range")
+    return value
+
+
+def parse_optional_text(raw, field):
+    if raw is not None and not isinstance(raw, str):
+        raise ValueError(f"{field} must be a string")
+    return raw
+
+# Runs DB lookups that can overlap with others in the same request (each in its own app context/session)
+db_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ragapp-db")
+
+
+def fetch_recent_userqueries(app, conversation_id, limit=3):
+    """Last user queries of a conversation, newest first, read through a separate session."""
+    with app.app_context():
+        return [
+            history.userquery for history in ChatHistory.query.filter_by(
+                conversationid=conversation_id
+            ).order_by(ChatHistory.timestamp.desc()).limit(limit)
+        ]
+
+
+HISTORY_MODES = ("turn", "delta", "full")
+
+
+def history_rows(conversation_id, after=None, limit=None, newest=False, with_citations=False):
+    """Chat turns of a conversation in (timestamp, historyid) order, without the document JSON blobs.
+
+    after is a (timestamp, historyid) keyset cursor; historyid may be None to resume from a
+    timestamp only. With limit, returns (rows, has_more); newest=True takes the last rows
+    instead of the first (still returned oldest first).
+    """
+    columns = [ChatHistory.historyid, ChatHistory.userquery, ChatHistory.llmresponse, ChatHistory.timestamp]
+    if with_citations:
+        columns.append(ChatHistory.citation_data)
+    query = db.session.query(*columns).filter(ChatHistory.conversationid == conversation_id)
+
+    if newest:
+        # Newest rows first, so "after" cannot apply; the delta cursor is turned into a lower bound instead
+        if after is not None:
+            query = query.filter(ChatHistory.timestamp > after[0])
+        rows, has_more = keyset_page(
+            query, [ChatHistory.timestamp, ChatHistory.historyid], limit=limit, descending=True
+        )
+        return rows[::-1], has_more
+    return keyset_page(query, [ChatHistory.timestamp, ChatHistory.historyid], after=after, limit=limit)
+
+
+def page_args(default_limit, max_limit):
+    """(limit, after) from ?limit= and ?cursor=; raises ValueError for bad values."""
+    limit = parse_limit(request.args.get("limit"), default_limit, max_limit)
+    cursor = request.args.get("cursor")
+    return limit, (decode_keyset_cursor(cursor) if cursor else None)
+
+
+def format_history_turn(row):
+    return {
+        "userquery": row.userquery,
+        "llmresponse": row.llmresponse,
+        "timestamp": row.timestamp.strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def persist_chat_turn(**values):
+    """Hand a chat turn to the write-behind queue; returns an unsaved ChatHistory for building the response."""
+    write_behind.add("chat_history", values)
+    return ChatHistory(**values)
+
+
+def with_pending_turn(rows, turn):
+    """Append a turn that may not be committed yet, dropping its row if the worker already wrote it."""
+    rows = [row for row in rows if (row.timestamp, row.userquery) != (turn.timestamp, turn.userquery)]
+    return rows + [turn]
+
+
+def load_conversation_context(conversation_id, useremail=None, check_owner=False):
+    """Check the conversation row and fetch its recent queries concurrently.
+
+    Returns (exists, history_userquery, timings). The history query only needs the id, so it
+    runs on db_executor while the existence check runs on the request's own session.
+    """
+    timer = StageTimer()
+    app = current_app._get_current_object()
+
+    def timed_history_lookup():
+        with timer.stage("history_lookup"):
+            return fetch_recent_userqueries(app, conversation_id)
+
+    history_future = db_executor.submit(timed_history_lookup)
+    with timer.stage("conversation_lookup"):
+        filters = {"conversationid": conversation_id}
+        if check_owner:
+            filters["useremail"] = useremail
+        exists = db.session.query(ChatConversation.query.filter_by(**filters).exists()).scalar()
+    history_userquery = history_future.result()
+    return exists, history_userquery, timer.as_dict()
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def sse_response(events):
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def stream_chat_events(conversation_id, userquery, history_userquery, useremail, response_meta):
+    """Relay the streaming pipeline as SSE frames and persist the turn once the stream completes."""
+    yield sse_event("meta", dict(response_meta, conversation_id=conversation_id))
+    try:
+        for event, data in get_response_llm().stream_filtered_response(userquery, history_userquery):
+            if event != "done":
+                yield sse_event(event, data)
+                continue
+
+            timestamp = datetime.utcnow()
+            persist_chat_turn(
+                conversationid=conversation_id,
+                useremail=useremail,
+                userquery=userquery,
+                llmresponse=data["llmresponse"],
+                top_n_document=data["top_n_document"],
+                citation_data=data["citation_data"],
+                timestamp=timestamp
+            )
+            logger.debug(f"Queued streamed chat history for conversation {conversation_id}")
+
+            response_data = dict(
+                response_meta,
+                conversation_id=conversation_id,
+                llmresponse=data["llmresponse"],
+                citation_data=data["citation_data"],
+                documents=data["top_n_document"],
+                timestamp=timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+            )
+            response_data["token-details"] = data["token_details"]
+            response_logger.append_to_json_file(response_data)
+            yield sse_event("done", response_data)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Streaming chat error: {str(e)}", exc_info=True)
+        yield sse_event("error", {"error": f"Internal server error: {str(e)}"})
+
+
 '''
 USER BASED RATE LIMITOR, ALTERNATIVE TO IP BASED
 def get_user_email():
@@ -47,6 +222,16 @@ IMPLEMENTATION: @limiter.limit("10 per minute", key_func=get_user_email)
 
 
 
+@ragapp_bp.route('/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: 200 once this worker's models are loaded and warmed up."""
+    status = model_status()
+    # Write-behind depth and spill counters, for spotting a database that cannot keep up
+    status["persistence"] = write_behind.stats()
+    status["db_queries"] = query_stats.report()
+    return jsonify(status), 200 if status["ready"] else 503
+
+
 @ragapp_bp.route('/chat', methods=['POST', 'OPTIONS'])
 @limiter.limit("20 per minute")
 def chat():
@@ -64,12 +249,23 @@ def chat():
     userquery = data.get("userquery")
     conversation_id = parse_conversation_id(data.get("conversation_id"))
     session_id = session.sid
+    history_mode = (data.get("history_mode") or CHAT_HISTORY_MODE).lower()
 
     if not userquery:
         logger.error("No user query provided")
         return jsonify({"error": "Query is required"}), 400
+    if history_mode not in HISTORY_MODES:
+        return jsonify({"error": f"history_mode must be one of {', '.join(HISTORY_MODES)}"}), 400
+    history_cursor = None
+    if history_mode == "delta" and data.get("history_cursor"):
+        try:
+            history_cursor = decode_keyset_cursor(data["history_cursor"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
     try:
+        history_userquery = []
+        db_timings = {}
         if not conversation_id:
             new_conversation = ChatConversation(
                 useremail=None,
@@ -77,28 +273,23 @@ def chat():
                 created_at=datetime.utcnow()
             )
             db.session.add(new_conversation)
-            db.session.flush()
+            # The turn is written behind the response, so its conversation row must exist first
+            db.session.commit()
             conversation_id = new_conversation.conversationid
             logger.debug(f"Created new conversation: {conversation_id}")
         else:
-            existing_conversation = ChatConversation.query.filter_by(
-                conversationid=conversation_id
-            ).first()
-            if not existing_conversation:
+            exists, history_userquery, db_timings = load_conversation_context(conversation_id)
+            if not exists:
                 logger.error(f"Conversation {conversation_id} not found")
                 return jsonify({"error": "Conversation history not found"}), 404
 
-        history_userquery = [
-            history.userquery for history in ChatHistory.query.filter_by(
-                conversationid=conversation_id
-            ).order_by(ChatHistory.timestamp.desc()).limit(3)
-        ]
-
-        llmresponse, top_n_document, citation_data, context_data, token_details = response_llm.generate_filtered_response(
+        llmresponse, top_n_document, citation_data, context_data, token_details = get_response_llm().generate_filtered_response(
             userquery, history_userquery
         )
+        # Kept apart from Stage-Timings: the DB timer's own wall/overlap would overwrite the pipeline's
+        token_details["DB-Timings"] = db_timings
 
-        new_history = ChatHistory(
+        new_history = persist_chat_turn(
             conversationid=conversation_id,
             useremail=None,
             userquery=userquery,
@@ -107,28 +298,35 @@ def chat():
             citation_data=citation_data,
             timestamp=datetime.utcnow()
         )
-        db.session.add(new_history)
-        db.session.commit()
-        logger.debug(f"Saved chat history for conversation {conversation_id}")
-
-        conversation_history = [
-            {
-                "userquery": history.userquery,
-                "llmresponse": history.llmresponse,
-                "timestamp": history.timestamp.strftime("%Y-%m-%d %H:%M:%S")
-            }
-            for history in ChatHistory.query.filter_by(conversationid=conversation_id)
-            .order_by(ChatHistory.timestamp.asc())
-        ]
+        logger.debug(f"Queued chat history for conversation {conversation_id}")
+
+        # Only "full" (and a delta after a long gap) reads more than the turn just written
+        history_truncated = False
+        if history_mode == "turn":
+            conversation_history = [format_history_turn(new_history)]
+        elif history_mode == "delta":
+            rows, history_truncated = history_rows(
+                conversation_id, after=history_cursor, limit=CHAT_HISTORY_DELTA_LIMIT, newest=True
+            )
+            conversation_history = [format_history_turn(row) for row in with_pending_turn(rows, new_history)]
+        else:
+            rows, _ = history_rows(conversation_id)
+            conversation_history = [format_history_turn(row) for row in with_pending_turn(rows, new_history)]
 
         response_data = {
             "user_type": "Un-Authenticated",
             "conversation_id": conversation_id,
             "conversation_history": {str(conversation_id): conversation_history},
+            "history_mode": history_mode,
+            # Pass back as history_cursor with history_mode="delta" to receive only newer turns
+            "history_cursor": encode_keyset_cursor(new_history.timestamp),
             "token-details": token_details,
             "documents": top_n_document,
             
         }
+        if history_truncated:
+            # Older turns after the cursor were left out; page through /conversation/<id>/history
+            response_data["history_truncated"] = True
 
         response_logger.append_to_json_file(response_data)
         logger.info(f"Chat response generated for conversation {conversation_id}")
@@ -162,50 +360,44 @@ def auth_chat():
             return jsonify({"error": "Query is required"}), 400
 
         try:
-            identity = json.loads(get_jwt_identity())
-            useremail = identity.get("email")
-            user = User.query.filter_by(email=useremail).first()
+            useremail = jwt_email()
+            signed_in = is_signed_in(useremail)
         except Exception as e:
             logger.error(f"Token validation error: {str(e)}", exc_info=True)
             return jsonify({"error": f"Invalid token or user lookup failed: {str(e)}"}), 401
 
-        if not user or not user.signinstatus:
+        if not signed_in:
             logger.error(f"User not logged in: {useremail}")
             return jsonify({"error": "User not logged in"}), 401
 
-        time_is = datetime.now()
+        time_is = datetime.now().replace(microsecond=0)
         formatted_time = time_is.strftime("%Y-%m-%d %H:%M:%S")
         try:
             history_userquery = []
+            db_timings = {}
             if not conversation_id:
                 new_conversation = ChatConversation(
                     useremail=useremail,
                     title=userquery[:50],
-                    created_at=formatted_time
+                    created_at=time_is
                 )
                 db.session.add(new_conversation)
-                db.session.flush()
+                db.session.commit()
                 conversation_id = new_conversation.conversationid
                 logger.debug(f"Created new authenticated conversation: {conversation_id}")
             else:
-                existing_conversation = ChatConversation.query.filter_by(
-                    conversationid=conversation_id, useremail=useremail
-                ).first()
-                if not existing_conversation:
+                exists, history_userquery, db_timings = load_conversation_context(
+                    conversation_id, useremail, check_owner=True
+                )
+                if not exists:
                     logger.error(f"Authenticated conversation {conversation_id} not found for {useremail}")
                     return jsonify({"error": "Conversation not found"}), 404
 
-                history_userquery = [
-                    history.userquery for history in ChatHistory.query.filter_by(
-                        conversationid=conversation_id
-                    ).order_by(ChatHistory.timestamp.desc()).limit(3).all()
-                ]
-
             #llmresponse, top_n_document, citation_data, context_data, token_details = response_llm.generate_filtered_response(
                 #userquery, history_userquery
             #)
             try:
-                llmresponse, top_n_document, citation_data, context_data, token_details = response_llm.generate_filtered_response(
+                llmresponse, top_n_document, citation_data, context_data, token_details = get_response_llm().generate_filtered_response(
                     userquery, history_userquery
                 )
             except Exception as e:
@@ -218,33 +410,31 @@ def auth_chat():
                 citation_data = []
                 context_data = []
                 token_details = {"llm": "disabled", "error": str(e)}
+            token_details["DB-Timings"] = db_timings
 
 
-            chat_history = ChatHistory(
-                useremail=user.email,
+            persist_chat_turn(
+                useremail=useremail,
                 conversationid=conversation_id,
                 userquery=userquery,
                 llmresponse=llmresponse,
                 top_n_document=top_n_document,
                 citation_data=citation_data,
-                timestamp=formatted_time
+                timestamp=time_is
             )
+            logger.debug(f"Queued authenticated chat history for conversation {conversation_id}")
 
-            conversation_history = {chat_history.conversationid: [{
+            conversation_history = {conversation_id: [{
                 "userquery": userquery,
                 "llmresponse": llmresponse,
                 "citation_data": citation_data,
                 "query-timestamp": formatted_time,
-                "user": user.email
+                "user": useremail
             }]}
 
-            db.session.add(chat_history)
-            db.session.commit()
-            logger.debug(f"Saved authenticated chat history for conversation {conversation_id}")
-
             response_data = {
                 "user_type": "Authenticated",
-                "user": user.email,
+                "user": useremail,
                 "conversation_id": conversation_id,
                 "conversation_history": conversation_history,
                 "token-details": token_details,
@@ -263,20 +453,137 @@ def auth_chat():
     return handle_post()
 
 
+@ragapp_bp.route('/chat/stream', methods=['POST', 'OPTIONS'])
+@limiter.limit("20 per minute")
+def chat_stream():
+    """Streaming variant of /chat: citations first, then completion tokens, as Server-Sent Events."""
+    if request.method == 'OPTIONS':
+        response = jsonify({"status": "ok"})
+        response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        response.headers.add('Access-Control-Allow-Credentials', 'true')
+        return response, 200
+
+    session.permanent = True
+    data = request.get_json()
+    userquery = data.get("userquery")
+    conversation_id = parse_conversation_id(data.get("conversation_id"))
+
+    if not userquery:
+        logger.error("No user query provided")
+        return jsonify({"error": "Query is required"}), 400
+
+    try:
+        history_userquery = []
+        db_timings = {}
+        if not conversation_id:
+            new_conversation = ChatConversation(
+                useremail=None,
+                title=userquery[:50],
+                created_at=datetime.utcnow()
+            )
+            db.session.add(new_conversation)
+            # Commit up front so the id is durable before the stream starts
+            db.session.commit()
+            conversation_id = new_conversation.conversationid
+            logger.debug(f"Created new conversation: {conversation_id}")
+        else:
+            exists, history_userquery, db_timings = load_conversation_context(conversation_id)
+            if not exists:
+                logger.error(f"Conversation {conversation_id} not found")
+                return jsonify({"error": "Conversation history not found"}), 404
+    except Exception as e:
+        logger.error(f"Chat stream error: {str(e)}", exc_info=True)
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+    return sse_response(stream_chat_events(
+        conversation_id, userquery, history_userquery, None,
+        {"user_type": "Un-Authenticated", "db-timings": db_timings}
+    ))
+
+
+@ragapp_bp.route('/auth/chat/stream', methods=['POST', 'OPTIONS'])
+@limiter.limit("30 per minute")
+def auth_chat_stream():
+    """Streaming variant of /auth/chat: citations first, then completion tokens, as Server-Sent Events."""
+    if request.method == 'OPTIONS':
+        response = jsonify({"status": "ok"})
+        response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        response.headers.add('Access-Control-Allow-Credentials', 'true')
+        return response, 200
+
+    @jwt_required()
+    def handle_post():
+        session.permanent = True
+        data = request.get_json()
+        userquery = data.get("userquery")
+        conversation_id = parse_conversation_id(data.get("conversation_id"))
+
+        if not userquery:
+            logger.error("No user query provided for authenticated chat")
+            return jsonify({"error": "Query is required"}), 400
+
+        try:
+            useremail = jwt_email()
+            signed_in = is_signed_in(useremail)
+        except Exception as e:
+            logger.error(f"Token validation error: {str(e)}", exc_info=True)
+            return jsonify({"error": f"Invalid token or user lookup failed: {str(e)}"}), 401
+
+        if not signed_in:
+            logger.error(f"User not logged in: {useremail}")
+            return jsonify({"error": "User not logged in"}), 401
+
+        try:
+            history_userquery = []
+            db_timings = {}
+            if not conversation_id:
+                new_conversation = ChatConversation(
+                    useremail=useremail,
+                    title=userquery[:50],
+                    created_at=datetime.now()
+                )
+                db.session.add(new_conversation)
+                db.session.commit()
+                conversation_id = new_conversation.conversationid
+                logger.debug(f"Created new authenticated conversation: {conversation_id}")
+            else:
+                exists, history_userquery, db_timings = load_conversation_context(
+                    conversation_id, useremail, check_owner=True
+                )
+                if not exists:
+                    logger.error(f"Authenticated conversation {conversation_id} not found for {useremail}")
+                    return jsonify({"error": "Conversation not found"}), 404
+        except Exception as e:
+            logger.error(f"Authenticated chat stream error: {str(e)}", exc_info=True)
+            return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+        return sse_response(stream_chat_events(
+            conversation_id, userquery, history_userquery, useremail,
+            {"user_type": "Authenticated", "user": useremail, "db-timings": db_timings}
+        ))
+
+    return handle_post()
+
+
 @ragapp_bp.route('/auth/conversations', methods=['GET'])
 @jwt_required()
 def get_user_conversations():
     """Fetch all conversations for the authenticated user."""
     try:
-        identity = json.loads(get_jwt_identity())
-        useremail = identity.get("email")
-        user = User.query.filter_by(email=useremail).first()
-        if not user or not user.signinstatus:
+        useremail = jwt_email()
+        if not is_signed_in(useremail):
             return jsonify({"error": "User not logged in"}), 401
 
-        conversations = ChatConversation.query.filter_by(
-            useremail=useremail
-        ).order_by(ChatConversation.created_at.desc()).all()
+        try:
+            limit, after = page_args(CONVERSATIONS_PAGE_SIZE, CONVERSATIONS_MAX_PAGE_SIZE)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        conversations, has_more = conversation_rows(useremail, after=after, limit=limit)
 
         result = []
         for conv in conversations:
@@ -287,7 +594,10 @@ def get_user_conversations():
             })
 
         logger.info(f"Fetched {len(result)} conversations for {useremail}")
-        return jsonify({"conversations": result}), 200
+        return jsonify({
+            "conversations": result,
+            "next_cursor": next_page_cursor(conversations, has_more, "created_at", "conversationid")
+        }), 200
 
     except Exception as e:
         logger.error(f"Get conversations error: {str(e)}", exc_info=True)
@@ -299,22 +609,23 @@ def get_user_conversations():
 def get_single_conversation(conversation_id):
     """Fetch a single conversation with full chat history for the authenticated user."""
     try:
-        identity = json.loads(get_jwt_identity())
-        useremail = identity.get("email")
-        user = User.query.filter_by(email=useremail).first()
-        if not user or not user.signinstatus:
+        useremail = jwt_email()
+        if not is_signed_in(useremail):
             return jsonify({"error": "User not logged in"}), 401
 
-        conversation = ChatConversation.query.filter_by(
-            conversationid=conversation_id, useremail=useremail
-        ).first()
+        try:
+            limit, after = page_args(CHAT_HISTORY_PAGE_SIZE, CHAT_HISTORY_MAX_PAGE_SIZE)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        conversation = db.session.query(
+            ChatConversation.conversationid, ChatConversation.title, ChatConversation.created_at
+        ).filter_by(conversationid=conversation_id, useremail=useremail).first()
 
         if not conversation:
             return jsonify({"error": "Conversation not found"}), 404
 
-        chat_history = ChatHistory.query.filter_by(
-            conversationid=conversation_id
-        ).order_by(ChatHistory.timestamp.asc()).all()
+        chat_history, has_more = history_rows(conversation_id, after=after, limit=limit, with_citations=True)
 
         history_data = [
             {
@@ -332,7 +643,8 @@ def get_single_conversation(conversation_id):
                 "conversationid": conversation.conversationid,
                 "title": conversation.title or "Untitled Chat",
                 "created_at": conversation.created_at.isoformat() if conversation.created_at else None,
-                "chat_history": history_data
+                "chat_history": history_data,
+                "next_cursor": next_page_cursor(chat_history, has_more, "timestamp", "historyid")
             }
         }), 200
 
@@ -346,18 +658,13 @@ def get_conversation_history(conversation_id):
     """Retrieve chat history for a specific conversation ID, with user validation for authenticated requests."""
     try:
         # Check if user is authenticated
-        useremail = None
-        identity = get_jwt_identity()
-        if identity:
-            identity_data = json.loads(identity)
-            useremail = identity_data.get("email")
-            user = User.query.filter_by(email=useremail).first()
-            if not user or not user.signinstatus:
-                logger.error(f"User not logged in: {useremail}")
-                return jsonify({"error": "User not logged in"}), 401
-
-        # Fetch conversation
-        conversation = ChatConversation.query.filter_by(conversationid=conversation_id).first()
+        useremail = jwt_email()
+        if useremail and not is_signed_in(useremail):
+            logger.error(f"User not logged in: {useremail}")
+            return jsonify({"error": "User not logged in"}), 401
+
+        # Only the owner is needed; skip loading the whole conversation row
+        conversation = db.session.query(ChatConversation.useremail).filter_by(conversationid=conversation_id).first()
         if not conversation:
             logger.error(f"Conversation {conversation_id} not found")
             return jsonify({"error": "Conversation not found"}), 404
@@ -367,23 +674,26 @@ def get_conversation_history(conversation_id):
             logger.error(f"User {useremail} not authorized for conversation {conversation_id}")
             return jsonify({"error": "Not authorized to access this conversation"}), 403
 
-        # Fetch chat history
-        chat_history = ChatHistory.query.filter_by(conversationid=conversation_id).order_by(ChatHistory.timestamp.asc()).all()
-        if not chat_history:
+        # Fetch one page of chat history (oldest first); next_cursor resumes after the last turn
+        try:
+            limit, after = page_args(CHAT_HISTORY_PAGE_SIZE, CHAT_HISTORY_MAX_PAGE_SIZE)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        chat_history, has_more = history_rows(conversation_id, after=after, limit=limit)
+        if not chat_history and after is None:
             logger.error(f"Conversation history not found for ID {conversation_id}")
             return jsonify({"error": "Conversation history not found"}), 404
 
-        conversation_history = [
-            {
-                "userquery": history.userquery,
-                "llmresponse": history.llmresponse,
-                "timestamp": history.timestamp.strftime("%Y-%m-%d %H:%M:%S")
-            }
-            for history in chat_history
-        ]
+        conversation_history = [format_history_turn(history) for history in chat_history]
+        next_cursor = next_page_cursor(chat_history, has_more, "timestamp", "historyid")
 
         logger.info(f"Retrieved conversation history for ID {conversation_id}")
-        return jsonify({"conversation_id": conversation_id, "conversation_history": conversation_history}), 200
+        return jsonify({
+            "conversation_id": conversation_id,
+            "conversation_history": conversation_history,
+            "next_cursor": next_cursor
+        }), 200
 
     except Exception as e:
         logger.error(f"Conversation history error: {str(e)}", exc_info=True)
@@ -402,27 +712,31 @@ def submit_feedback():
 
     data = request.get_json()
     vote = data.get("vote")
-    comment = data.get("comment", "")
-    conversation_id = data.get("conversation_id")
-    message_index = data.get("message_index")
-    userquery = data.get("userquery")
-    llmresponse = data.get("llmresponse")
 
     if vote not in ("up", "down"):
         return jsonify({"error": "Invalid vote value"}), 400
 
+    # Rows are written in batches with other users' turns, so reject anything the table would not accept here
+    try:
+        conversation_id = parse_optional_int(data.get("conversation_id"), "conversation_id")
+        message_index = parse_optional_int(data.get("message_index"), "message_index")
+        comment = parse_optional_text(data.get("comment", ""), "comment")
+        userquery = parse_optional_text(data.get("userquery"), "userquery")
+        llmresponse = parse_optional_text(data.get("llmresponse"), "llmresponse")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     try:
-        feedback = ChatFeedback(
+        write_behind.add("feedback", dict(
             conversation_id=conversation_id,
             message_index=message_index,
             vote=vote,
             comment=comment,
             userquery=userquery,
             llmresponse=llmresponse,
-        )
-        db.session.add(feedback)
-        db.session.commit()
-        logger.info(f"Feedback saved: {vote} for conversation {conversation_id}")
+            timestamp=datetime.utcnow()
+        ))
+        logger.info(f"Feedback queued: {vote} for conversation {conversation_id}")
         return jsonify({"message": "Feedback received, thank you!"}), 200
 
     except Exception as e:
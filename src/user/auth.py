@@ -4,6 +4,7 @@ from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
 import google_auth_oauthlib.flow
 from .models import User
+from .signin import remember_signin
 from extensions import db
 import os
 import json
@@ -99,6 +100,7 @@ def auth_callback():
             )
             db.session.add(user)
             db.session.commit()
+        remember_signin(user.email, True)
 
         access_token = create_access_token(
             identity=json.dumps({"email": user.email}),
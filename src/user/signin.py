@@ -0,0 +1,49 @@
+import json
+import threading
+from cachetools import TTLCache
+from flask_jwt_extended import get_jwt_identity
+from extensions import db
+from .models import User
+from config import SIGNIN_CACHE_TTL_SECONDS, SIGNIN_CACHE_SIZE
+
+# email -> signinstatus; saves the users lookup on every authenticated request
+_signin_cache = TTLCache(maxsize=SIGNIN_CACHE_SIZE, ttl=SIGNIN_CACHE_TTL_SECONDS) if SIGNIN_CACHE_TTL_SECONDS > 0 else None
+_signin_lock = threading.Lock()
+signin_cache_stats = {"hits": 0, "misses": 0}
+
+
+def jwt_email():
+    """Email from the JWT identity ({"email": ...} serialized at login); None for anonymous requests."""
+    identity = get_jwt_identity()
+    if not identity:
+        return None
+    return json.loads(identity).get("email")
+
+
+def is_signed_in(useremail):
+    """Whether the user exists and is signed in, answered from the TTL cache when possible.
+
+    Login and logout on this worker update the cache immediately; changes made by another
+    worker are seen after at most SIGNIN_CACHE_TTL_SECONDS.
+    """
+    if not useremail:
+        return False
+    if _signin_cache is None:
+        return bool(db.session.query(User.signinstatus).filter_by(email=useremail).scalar())
+
+    with _signin_lock:
+        status = _signin_cache.get(useremail)
+        signin_cache_stats["hits" if status is not None else "misses"] += 1
+    if status is None:
+        status = bool(db.session.query(User.signinstatus).filter_by(email=useremail).scalar())
+        with _signin_lock:
+            _signin_cache[useremail] = status
+    return status
+
+
+def remember_signin(useremail, status):
+    """Record a login (True) or logout (False) after it has been committed."""
+    if _signin_cache is None:
+        return
+    with _signin_lock:
+        _signin_cache[useremail] = bool(status)
@@ -5,11 +5,13 @@ from marshmallow import Schema, fields, ValidationError, validates
 import hashlib
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from datetime import timedelta
-from ragapp.models import ChatConversation
+from ragapp.pagination import parse_limit, decode_keyset_cursor, conversation_rows, next_page_cursor
+from config import CONVERSATIONS_PAGE_SIZE, CONVERSATIONS_MAX_PAGE_SIZE
 import json
 import re
 import logging
 from .serializers   import UserSchema
+from .signin import jwt_email, is_signed_in, remember_signin
 
 user_bp = Blueprint('user', __name__)
 
@@ -71,6 +73,7 @@ def login_user():
 
     user.signinstatus = True
     db.session.commit()
+    remember_signin(user.email, True)
 
     access_token = create_access_token(
         identity=json.dumps({"email": user.email}),
@@ -92,19 +95,40 @@ def login_user():
         'message': 'Login successful'
     }), 200
 
+@user_bp.route('/logout', methods=['POST'])
+@jwt_required()
+def logout_user():
+    """Mark the user signed out; their tokens stop working on authenticated endpoints."""
+    useremail = jwt_email()
+    user = db.session.get(User, useremail)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    user.signinstatus = False
+    db.session.commit()
+    remember_signin(useremail, False)
+
+    logger.info(f"User logged out: {useremail}")
+    return jsonify({'message': 'Logout successful'}), 200
+
 @user_bp.route('/auth/conversations', methods=['GET'])
 @jwt_required()
 def get_conversations():
-    """Retrieve all conversations for the authenticated user."""
+    """Retrieve the authenticated user's conversations, newest first, one keyset page at a time."""
     try:
-        identity = json.loads(get_jwt_identity())
-        useremail = identity.get("email")
-        user = User.query.filter_by(email=useremail).first()
-        if not user or not user.signinstatus:
+        useremail = jwt_email()
+        if not is_signed_in(useremail):
             logger.error(f"User not logged in: {useremail}")
             return jsonify({"error": "User not logged in"}), 401
 
-        conversations = ChatConversation.query.filter_by(useremail=useremail).order_by(ChatConversation.created_at.desc()).all()
+        try:
+            limit = parse_limit(request.args.get('limit'), CONVERSATIONS_PAGE_SIZE, CONVERSATIONS_MAX_PAGE_SIZE)
+            cursor = request.args.get('cursor')
+            after = decode_keyset_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        conversations, has_more = conversation_rows(useremail, after=after, limit=limit)
         conversations_data = [
             {
                 "conversationId": str(conversation.conversationid),
@@ -115,7 +139,8 @@ def get_conversations():
         ]
 
         logger.info(f"Retrieved {len(conversations_data)} conversations for user {useremail}")
-        return jsonify({"conversations": conversations_data}), 200
+        next_cursor = next_page_cursor(conversations, has_more, "created_at", "conversationid")
+        return jsonify({"conversations": conversations_data, "next_cursor": next_cursor}), 200
     except Exception as e:
         logger.error(f"Error retrieving conversations: {str(e)}", exc_info=True)
         return jsonify({"error": f"Error retrieving conversations: {str(e)}"}), 500
\ No newline at end of file
@@ -0,0 +1,4 @@
+from app import create_app
+
+# WSGI entry point: gunicorn --config src/gunicorn.conf.py wsgi:app
+app = create_app()